@@ -0,0 +1,165 @@
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class Logger:
+    """
+    Per-subsystem handle. Calls below the subsystem's level return after one
+    comparison; accepted calls append a (time, level, name, format, args)
+    tuple to the sink's queue and return. Formatting (printf-style, like the
+    logging module) happens on the writer thread, so pass values rather than
+    objects that will be mutated afterwards.
+    """
+
+    __slots__ = ("name", "level", "every", "seen", "sink")
+
+    def __init__(self, name, sink, level=INFO, every=1):
+        self.name = name
+        self.sink = sink
+        self.level = level
+        self.every = every  # Keep one record in N (for chatty subsystems)
+        self.seen = 0
+
+    def log(self, level, fmt, *args):
+        if level < self.level:
+            return
+        if self.every > 1 and level < WARNING:
+            self.seen += 1
+            if self.seen % self.every:
+                self.sink.sampled_out += 1
+                return
+        self.sink.emit((time.time(), level, self.name, fmt, args))
+
+    def debug(self, fmt, *args):
+        self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt, *args):
+        self.log(INFO, fmt, *args)
+
+    def warning(self, fmt, *args):
+        self.log(WARNING, fmt, *args)
+
+    def error(self, fmt, *args):
+        self.log(ERROR, fmt, *args)
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+
+class LogSink:
+    """
+    Bounded record queue drained by a daemon writer thread.
+
+    `emit` never blocks: when `maxsize` records are already waiting the
+    record is dropped and counted (per subsystem), so a stalled stdout can't
+    stall the event loop. Warnings and errors are never sampled out.
+    """
+
+    def __init__(self, stream=None, maxsize=65536, flush_interval=0.05):
+        self.stream = stream or sys.stdout
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.records = deque()  # append/popleft are atomic, so no lock is needed
+        self.loggers = {}
+        self.dropped = {}  # Subsystem -> records dropped because the queue was full
+        self.sampled_out = 0
+        self.written = 0
+        self.enabled = True
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def get(self, name, level=None, every=None):
+        logger = self.loggers.get(name)
+        if logger is None:
+            logger = self.loggers[name] = Logger(name, self)
+        if level is not None:
+            logger.level = level
+        if every is not None:
+            logger.every = every
+        return logger
+
+    def configure(self, levels=None, sampling=None):
+        """Set levels ({subsystem: level}) and sampling ({subsystem: every}) in one go."""
+        for name, level in (levels or {}).items():
+            self.get(name, level=LEVEL_NAMES_BY_TEXT.get(level, level) if isinstance(level, str) else level)
+        for name, every in (sampling or {}).items():
+            self.get(name, every=every)
+
+    def emit(self, record):
+        if not self.enabled:
+            return
+        if len(self.records) >= self.maxsize:
+            name = record[2]
+            self.dropped[name] = self.dropped.get(name, 0) + 1
+            return
+        self.records.append(record)
+        if self.thread is None:
+            self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        records = self.records
+        while not self.stopping.is_set():
+            if not records:
+                self.stopping.wait(self.flush_interval)
+                continue
+            self.drain()
+
+    def drain(self, batch=64):
+        """
+        Format and write queued records. Writing every `batch` records
+        releases the GIL regularly, so the event loop thread never waits
+        a whole switch interval behind a long formatting run.
+        """
+        records = self.records
+        while records:
+            lines = []
+            while records and len(lines) < batch:
+                created, level, name, fmt, args = records.popleft()
+                try:
+                    message = fmt % args if args else fmt
+                except (TypeError, ValueError) as e:
+                    message = f"{fmt!r} % {args!r} failed: {e}"
+                stamp = time.strftime("%H:%M:%S", time.localtime(created))
+                lines.append(f"{stamp}.{int(created * 1000) % 1000:03d} {LEVEL_NAMES.get(level, level)} {name}: {message}\n")
+            self.stream.write("".join(lines))
+            self.written += len(lines)
+        self.stream.flush()
+
+    def close(self):
+        """Stop the writer thread and write out whatever is still queued."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.drain()
+        self.stopping.clear()
+
+    def stats(self):
+        return {
+            "queued": len(self.records),
+            "written": self.written,
+            "dropped": dict(self.dropped),
+            "sampled_out": self.sampled_out,
+        }
+
+
+LEVEL_NAMES_BY_TEXT = {name: level for level, name in LEVEL_NAMES.items()}
+
+sink = LogSink()
+
+
+def get_logger(name, level=None, every=None):
+    """Logger for a subsystem on the shared background sink."""
+    return sink.get(name, level, every)
@@ -0,0 +1,402 @@
+"""
+Micro-benchmarks for the hot paths of the market data handlers.
+
+Run with `python bench.py <name>` (or no argument for all of them). Inputs are
+synthetic but shaped like production traffic.
+"""
+import random
+import sys
+import time
+
+
+def _kraken_messages(depth, count, levels_per_update=4, seed=7):
+    rng = random.Random(seed)
+    mid = 1.0
+    snapshot = {
+        "bids": [{"price": round(mid - 0.0001 * (i + 1), 4), "qty": rng.uniform(1, 5000)} for i in range(depth)],
+        "asks": [{"price": round(mid + 0.0001 * (i + 1), 4), "qty": rng.uniform(1, 5000)} for i in range(depth)],
+    }
+    updates = []
+    for _ in range(count):
+        update = {"bids": [], "asks": []}
+        for _ in range(levels_per_update):
+            side = rng.choice(("bids", "asks"))
+            offset = 0.0001 * rng.randint(1, depth)
+            price = round(mid - offset if side == "bids" else mid + offset, 4)
+            qty = 0 if rng.random() < 0.2 else rng.uniform(1, 5000)
+            update[side].append({"price": price, "qty": qty})
+        updates.append(update)
+    return snapshot, updates
+
+
+def bench_kraken_book(depth=1000, count=2000):
+    """Per-message cost of the Kraken book update: per-level Polars concat/filter vs BookSide."""
+    import polars as pl
+    from orderbook import BookSide
+
+    snapshot, updates = _kraken_messages(depth, count)
+
+    def legacy_apply(book, levels, side):
+        # The previous OBFeed.update_order_book loop, minus the Decimal checks
+        for level in levels:
+            price, qty = level["price"], level["qty"]
+            if qty == 0:
+                book[side] = book[side].filter(pl.col("price") != str(price))
+            else:
+                book[side] = pl.concat([book[side], pl.DataFrame({"price": [str(price)], "qty": [str(qty)]})])
+
+    def run_legacy():
+        empty = pl.DataFrame({"price": pl.Series(dtype=pl.Utf8), "qty": pl.Series(dtype=pl.Utf8)})
+        book = {"bids": empty, "asks": empty}
+        legacy_apply(book, snapshot["bids"], "bids")
+        legacy_apply(book, snapshot["asks"], "asks")
+        start = time.perf_counter()
+        for update in updates:
+            legacy_apply(book, update["bids"], "bids")
+            legacy_apply(book, update["asks"], "asks")
+        return (time.perf_counter() - start) / count
+
+    def run_native():
+        bids = BookSide(is_bid=True, capacity=depth + 64, top_levels=depth)
+        asks = BookSide(is_bid=False, capacity=depth + 64, top_levels=depth)
+        for level in snapshot["bids"]:
+            bids.update(level["price"], level["qty"])
+        for level in snapshot["asks"]:
+            asks.update(level["price"], level["qty"])
+        start = time.perf_counter()
+        for update in updates:
+            for side, levels in ((bids, update["bids"]), (asks, update["asks"])):
+                for level in levels:
+                    if level["qty"] == 0:
+                        side.delete(level["price"])
+                    else:
+                        side.update(level["price"], level["qty"])
+                side.truncate(depth)
+        return (time.perf_counter() - start) / count
+
+    legacy = run_legacy()
+    native = run_native()
+    print(f"kraken book depth={depth}: polars {legacy * 1e6:.1f} us/msg, native {native * 1e6:.1f} us/msg "
+          f"({legacy / native:.0f}x)")
+
+
+def _deribit_frames(count, seed=11):
+    """A full-book message mix: raw book deltas dominate, plus candles, tickers, DVOL and fills."""
+    import orjson
+
+    rng = random.Random(seed)
+    frames = []
+    change_id = 1
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.70:
+            levels = lambda: [[rng.choice(("new", "change", "delete")), 60000 + 0.5 * rng.randint(-400, 400), float(rng.randint(0, 50000))]
+                              for _ in range(rng.randint(1, 6))]
+            data = {"type": "change", "timestamp": 1700000000000, "prev_change_id": change_id, "instrument_name": "BTC-PERPETUAL",
+                    "change_id": change_id + 1, "bids": levels(), "asks": levels()}
+            channel = "book.BTC-PERPETUAL.raw"
+            change_id += 1
+        elif roll < 0.75:
+            data = {"tick": 1700000000000, "open": 60000.0, "high": 60010.0, "low": 59990.0, "close": 60005.0,
+                    "volume": 12.5, "cost": 750000.0}
+            channel = "chart.trades.BTC-PERPETUAL.1"
+        elif roll < 0.90:
+            data = {"timestamp": 1700000000000, "stats": {"volume_usd": 1.2e9, "volume": 20000.0, "price_change": -0.5, "low": 59000.0, "high": 61000.0},
+                    "state": "open", "settlement_price": 60000.0, "open_interest": 1.1e9, "min_price": 59100.0, "max_price": 60900.0,
+                    "mark_price": 60001.5, "last_price": 60001.0, "instrument_name": "BTC-PERPETUAL", "index_price": 60000.2,
+                    "funding_8h": 0.0001, "estimated_delivery_price": 60000.2, "current_funding": 0.0, "best_bid_price": 60000.5,
+                    "best_bid_amount": 10000.0, "best_ask_price": 60001.0, "best_ask_amount": 20000.0}
+            channel = "ticker.BTC-PERPETUAL.100ms"
+        elif roll < 0.95:
+            data = {"volatility": 52.3, "timestamp": 1700000000000, "index_name": "btc_usd"}
+            channel = "deribit_volatility_index.btc_usd"
+        else:
+            data = {"trades": [], "positions": [], "orders": [], "instrument_name": "BTC-PERPETUAL"}
+            channel = "user.changes.future.BTC.100ms"
+        frames.append(orjson.dumps({"jsonrpc": "2.0", "method": "subscription", "params": {"channel": channel, "data": data}}))
+    return frames
+
+
+def bench_frame_decode(count=50000):
+    """Per-frame decode cost: orjson on every frame vs skipping sampled tickers and DVOL before decoding."""
+    import tracemalloc
+    from collections import deque
+
+    import orjson
+    from frames import FrameFilter
+
+    frames = _deribit_frames(count)
+
+    def full_decode(out):
+        for raw in frames:
+            out.append(orjson.loads(raw))
+
+    def make_filtered(frame_filter):
+        prefixes = frame_filter.prefixes
+
+        def run(out):
+            # The check DbitWS.handle_frame does before decoding
+            for raw in frames:
+                if prefixes and raw.startswith(prefixes) and not frame_filter.should_decode(raw):
+                    continue
+                out.append(orjson.loads(raw))
+        return run
+
+    sampled = FrameFilter()
+    sampled.sample("ticker.BTC-PERPETUAL.100ms", 10)
+    sampled.sample("deribit_volatility_index.btc_usd", 20)
+
+    runs = (("full decode", full_decode), ("nothing sampled", make_filtered(FrameFilter())), ("skip sampled channels", make_filtered(sampled)))
+    # Interleaved rounds, best of each: the variants see the same machine noise
+    best = dict.fromkeys(name for name, _ in runs)
+    for _ in range(25):
+        for name, fn in runs:
+            out = deque(maxlen=0)  # Discard results so the timing excludes GC of a growing list
+            start = time.perf_counter()
+            fn(out)
+            elapsed = time.perf_counter() - start
+            best[name] = elapsed if best[name] is None else min(best[name], elapsed)
+
+    for name, fn in runs:
+        # Memory held by the decoded messages, as if they were all waiting in the queue
+        tracemalloc.start()
+        out = []
+        fn(out)
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name}: {best[name] / count * 1e6:.2f} us/frame, {held / count:.0f} B/frame held")
+
+
+def bench_log_lag(count=20000, rate=20000):
+    """Event loop lag while a handler logs every message: print vs background logger vs off."""
+    import asyncio
+    import os
+    import threading
+
+    from asynclog import INFO, ERROR, LogSink
+
+    # stdout stand-in: a pipe whose reader is a little slow, like a terminal or a log shipper
+    read_fd, write_fd = os.pipe()
+    stream = os.fdopen(write_fd, "w", buffering=1)
+    stopping = threading.Event()
+
+    def slow_reader():
+        while not stopping.is_set():
+            if not os.read(read_fd, 4096):
+                break
+            time.sleep(0.0002)
+
+    reader = threading.Thread(target=slow_reader, daemon=True)
+    reader.start()
+
+    order = {"order_id": "ETH-123456789", "order_state": "open", "price": 60000.5, "amount": 10.0, "direction": "buy",
+             "instrument_name": "BTC-PERPETUAL", "label": "stoikov_bid", "filled_amount": 0.0, "post_only": True,
+             "creation_timestamp": 1700000000000, "last_update_timestamp": 1700000000001, "time_in_force": "good_til_cancelled"}
+
+    async def run(mode):
+        sink = LogSink(stream=stream)
+        log = sink.get("bench", level=ERROR if mode == "off" else INFO)
+        lags = []
+        handler_ns = 0
+        done = asyncio.Event()
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - start - 0.001)
+
+        async def feed():
+            nonlocal handler_ns
+            for i in range(count):
+                start = time.perf_counter_ns()
+                if mode == "print":
+                    print(f"Updated order state: {order}", file=stream)
+                else:
+                    log.info("Updated order state: %s", order)
+                handler_ns += time.perf_counter_ns() - start
+                if i % (rate // 1000) == 0:
+                    await asyncio.sleep(0.001)  # Roughly `rate` messages per second
+            done.set()
+
+        await asyncio.gather(probe(), feed())
+        sink.close()
+        lags.sort()
+        return handler_ns / count / 1e3, lags[len(lags) // 2] * 1e3, lags[int(len(lags) * 0.99)] * 1e3, sink.stats()
+
+    for mode in ("print", "asynclog", "off"):
+        handler_us, p50, p99, stats = asyncio.run(run(mode))
+        extra = f", dropped {sum(stats['dropped'].values())}" if mode == "asynclog" else ""
+        print(f"{mode}: handler {handler_us:.2f} us/msg, loop lag p50 {p50:.3f} ms, p99 {p99:.3f} ms{extra}")
+
+    stopping.set()
+    stream.close()
+    reader.join()
+    os.close(read_fd)
+
+
+def _exchange(port, ready, rate, seed=5):
+    """Stand-in exchange: answers requests and floods every book subscription with deltas."""
+    import asyncio
+
+    import orjson
+    import websockets
+
+    rng = random.Random(seed)
+
+    def book_frame(channel, kind, change_id, levels):
+        data = {"type": kind, "timestamp": int(time.time() * 1000), "instrument_name": channel.split(".")[1],
+                "prev_change_id": change_id - 1, "change_id": change_id,
+                "bids": [["new" if kind == "snapshot" else "change", 60000 - 0.5 * rng.randint(1, 400), float(rng.randint(1, 50000))]
+                         for _ in range(levels)],
+                "asks": [["new" if kind == "snapshot" else "change", 60000 + 0.5 * rng.randint(1, 400), float(rng.randint(1, 50000))]
+                         for _ in range(levels)]}
+        return orjson.dumps({"jsonrpc": "2.0", "method": "subscription", "params": {"channel": channel, "data": data}})
+
+    async def flood(websocket, channels):
+        change_id = 1
+        for channel in channels:
+            await websocket.send(book_frame(channel, "snapshot", change_id, 400))
+        burst = max(1, rate // 1000)
+        while True:
+            for _ in range(burst):
+                change_id += 1  # Shared by the channels, so each sees a contiguous sequence
+                for channel in channels:
+                    await websocket.send(book_frame(channel, "change", change_id, 3))
+            await asyncio.sleep(0.001)  # At most `rate` frames per second per channel
+
+    async def handle(websocket):
+        streams = []
+        order_id = 0
+        try:
+            async for raw in websocket:
+                message = orjson.loads(raw)
+                method = message["method"]
+                if method == "public/auth":
+                    result = {"access_token": "token", "refresh_token": "refresh"}
+                elif method in ("private/buy", "private/sell"):
+                    order_id += 1
+                    result = {"order": {"order_id": str(order_id), "order_state": "open"}}
+                elif method.endswith("/subscribe"):
+                    result = message["params"]["channels"]
+                else:
+                    result = "ok"
+                await websocket.send(orjson.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result}))
+                if method == "public/subscribe":
+                    streams.append(asyncio.create_task(flood(websocket, message["params"]["channels"])))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for stream in streams:
+                stream.cancel()
+
+    async def serve():
+        async with websockets.serve(handle, "127.0.0.1", port, max_queue=None):
+            ready.set()
+            await asyncio.Future()
+
+    asyncio.run(serve())
+
+
+def bench_ack_latency(orders=200, rate=2500, instruments=4, port=8765):
+    """Order-ack latency while book deltas flood in: everything on one socket vs trading + market data sockets."""
+    import asyncio
+    import multiprocessing
+
+    from asynclog import sink
+    from dbitws import DbitWS
+
+    sink.configure({"dbitws": "ERROR", "dbitws.book": "ERROR", "dbitws.orders": "ERROR"})
+    ready = multiprocessing.Event()
+    exchange = multiprocessing.Process(target=_exchange, args=(port, ready, rate), daemon=True)
+    exchange.start()
+    ready.wait(10)
+
+    async def run(market_data_connections):
+        ws = DbitWS()
+        ws.url = f"ws://127.0.0.1:{port}"
+        ws.market_data_connections = market_data_connections
+        ws.risk_aversion = 0.1
+        ws.time_horizon = 1
+        ws.current_volatility = 0.5
+        ws.configure_rate_limits({"matching_engine": {"max_credits": 1000, "refill_rate": 1000}})
+        await ws.connect()
+        await ws.subscribe_channels([f"book.BTC-{i}.raw" for i in range(instruments)], [])
+        await asyncio.sleep(0.5)  # Let the flood reach steady state
+        ws.latency.reset()
+        for i in range(orders):
+            await ws.request("private/buy", {"instrument_name": "BTC-0", "amount": 10, "type": "limit", "price": 50000.0})
+            await asyncio.sleep(0.005)
+        ack = ws.latency.report()["ack"]
+        frames = sum(connection.frames for connection in ws.connections)
+        await ws.close()
+        return ack, frames
+
+    try:
+        for market_data_connections in (0, 1, 2):
+            ack, frames = asyncio.run(run(market_data_connections))
+            label = "single socket" if not market_data_connections else f"trading + {market_data_connections} market data"
+            print(f"{label}: ack p50 {ack['p50'] / 1e3:.0f} us, p99 {ack['p99'] / 1e3:.0f} us, "
+                  f"max {ack['max'] / 1e3:.0f} us ({frames} frames)")
+    finally:
+        exchange.terminate()
+        exchange.join()
+
+
+def bench_stoikov_batch(instruments=120, cycles=20000):
+    """Per-cycle cost of quoting a futures curve plus options: scalar loop vs BatchStoikov."""
+    import math
+
+    import numpy as np
+    from calculations import BatchStoikov
+
+    rng = np.random.default_rng(3)
+    names = [f"BTC-{i}" for i in range(instruments)]
+    mids = 60000 + rng.normal(0, 500, instruments)
+    inventories = rng.integers(-50, 50, instruments).astype(float)
+    sigmas = rng.uniform(0.2, 1.5, instruments)
+    gammas = rng.uniform(0.05, 0.5, instruments)
+    kappas = rng.uniform(0.5, 3, instruments)
+    ticks = np.where(np.arange(instruments) < 40, 2.5, 0.0005)
+    batch = BatchStoikov(names, gammas, kappas, 1.0, ticks)
+
+    def scalar():
+        bids = []
+        asks = []
+        for i in range(instruments):
+            gamma, tick = gammas[i], ticks[i]
+            variance = gamma * sigmas[i] ** 2
+            reservation = mids[i] - inventories[i] * variance
+            half = (variance + (2 / gamma) * math.log(1 + gamma / kappas[i])) / 2
+            bids.append(math.floor((reservation - half) / tick) * tick)
+            asks.append(math.ceil((reservation + half) / tick) * tick)
+        return bids, asks
+
+    bids, asks = scalar()
+    batch_bids, batch_asks = batch.quote(mids, inventories, sigmas)
+    assert np.allclose(bids, batch_bids) and np.allclose(asks, batch_asks)
+
+    for name, fn in (("scalar loop", scalar), ("BatchStoikov", lambda: batch.quote(mids, inventories, sigmas))):
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(cycles // 10):
+                fn()
+            elapsed = (time.perf_counter() - start) / (cycles // 10)
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name}: {best * 1e6:.1f} us/cycle for {instruments} instruments")
+
+
+BENCHMARKS = {
+    "kraken_book": bench_kraken_book,
+    "frame_decode": bench_frame_decode,
+    "log_lag": bench_log_lag,
+    "ack_latency": bench_ack_latency,
+    "stoikov_batch": bench_stoikov_batch,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -1,39 +1,45 @@
 import math
+from functools import lru_cache
+
+import numpy as np
+
+from asynclog import get_logger
+
+log = get_logger("calculations")
 
 def round_to_tick(price, tick_size=2.5):
     """Rounds the price to the nearest tick size."""
     return round(price / tick_size) * tick_size
 
+@lru_cache(maxsize=256)
+def spread_term(gamma, kappa):
+    """The parameter-only part of the optimal spread, (2/gamma) * log(1 + gamma/kappa)."""
+    return (2 / gamma) * math.log1p(gamma / kappa)
+
 def calculate_stoikov(order_book, inventory, current_volatility, risk_aversion, time_horizon, tick_size=2.5):
     # Ensure the order book is not empty
     if not order_book:
         raise ValueError("Order book is empty")
 
-    # Retrieve the best bid and best ask
-    best_bid = None
-    best_ask = None
+    # Retrieve the best bid and best ask straight from the top of each side
+    best_bid, _ = order_book.best_bid()
+    best_ask, _ = order_book.best_ask()
 
-    # Iterate through the order book to find the best bid and ask
-    for price, (side, amount) in order_book.items():
-        if side == 'bid':
-            if best_bid is None or price > best_bid:
-                best_bid = price
-        elif side == 'ask':
-            if best_ask is None or price < best_ask:
-                best_ask = price
+    if current_volatility is None:
+        # No DVOL tick or realized bar yet: nothing to size the spread with
+        log.debug("No volatility yet, not quoting.")
+        return None, None, None, None, None, None
 
     # Calculate mid price and spread
     if best_bid is not None and best_ask is not None:
         mid_price = (best_bid + best_ask) / 2
         spread = best_ask - best_bid
     else:
-        print("Insufficient data to calculate mid price and spread.")
+        log.debug("Insufficient data to calculate mid price and spread.")
         return None, None, None, None, None, None
 
-    # Calculate trade imbalance
-    buy_volume = sum(amount for _, (side, amount) in order_book.items() if side == 'bid')
-    sell_volume = sum(amount for _, (side, amount) in order_book.items() if side == 'ask')
-    trade_imbalance = (buy_volume - sell_volume) / (buy_volume + sell_volume) if (buy_volume + sell_volume) > 0 else 0
+    # Trade imbalance is maintained incrementally by the book
+    trade_imbalance = order_book.imbalance
 
     # Calculate optimal bid and ask using Stoikov model
     gamma = risk_aversion
@@ -42,7 +48,7 @@ def calculate_stoikov(order_book, inventory, current_volatility, risk_aversion,
     q = inventory
 
     reservation_price = mid_price - (q * gamma * sigma**2 * T)
-    optimal_spread = gamma * sigma**2 * T + (2/gamma) * math.log(1 + (gamma/2))
+    optimal_spread = gamma * sigma**2 * T + spread_term(gamma, 2)
 
     optimal_bid = reservation_price - optimal_spread / 2
     optimal_ask = reservation_price + optimal_spread / 2
@@ -60,4 +66,101 @@ def calculate_stoikov(order_book, inventory, current_volatility, risk_aversion,
     optimal_bid = round_to_tick(optimal_bid, tick_size)
     optimal_ask = round_to_tick(optimal_ask, tick_size)
 
-    return mid_price, spread, best_bid, best_ask, optimal_bid, optimal_ask
\ No newline at end of file
+    return mid_price, spread, best_bid, best_ask, optimal_bid, optimal_ask
+
+
+class BatchStoikov:
+    """
+    Stoikov quotes for many instruments in one vectorized pass.
+
+    Per-instrument parameters (gamma, kappa, T, tick size) are set once with
+    `set_params` / `set_instrument`; the terms that only depend on them,
+    gamma*T and (2/gamma)*log(1 + gamma/kappa), are cached until they change.
+    `quote` then only does a handful of array operations on the market
+    inputs, writing into preallocated buffers:
+
+        reservation = mid - q * gamma * sigma**2 * T
+        spread      = gamma * sigma**2 * T + (2/gamma) * log(1 + gamma/kappa)
+
+    Bids are rounded down and asks up to each instrument's tick, so a quote
+    never lands inside the model spread.
+    """
+
+    def __init__(self, instruments, gamma=0.1, kappa=1.5, T=1.0, tick_size=2.5):
+        self.instruments = list(instruments)
+        self.index = {name: i for i, name in enumerate(self.instruments)}
+        n = len(self.instruments)
+        self.gamma = np.empty(n)
+        self.kappa = np.empty(n)
+        self.T = np.empty(n)
+        self.tick_size = np.empty(n)
+        self.gamma_T = np.empty(n)  # Cached: gamma * T
+        self.spread_term = np.empty(n)  # Cached: (2/gamma) * log(1 + gamma/kappa)
+        # Scratch and output buffers, reused every call
+        self._variance = np.empty(n)
+        self._skew = np.empty(n)
+        self._half_spread = np.empty(n)
+        self.bids = np.empty(n)
+        self.asks = np.empty(n)
+        self.set_params(gamma, kappa, T, tick_size)
+
+    def set_params(self, gamma=None, kappa=None, T=None, tick_size=None):
+        """Set parameters for every instrument; scalars are broadcast, None leaves a parameter as it is."""
+        for name, value in (("gamma", gamma), ("kappa", kappa), ("T", T), ("tick_size", tick_size)):
+            if value is not None:
+                getattr(self, name)[:] = value
+        self._refresh()
+
+    def set_instrument(self, instrument_name, gamma=None, kappa=None, T=None, tick_size=None):
+        """Change one instrument's parameters."""
+        i = self.index[instrument_name]
+        for name, value in (("gamma", gamma), ("kappa", kappa), ("T", T), ("tick_size", tick_size)):
+            if value is not None:
+                getattr(self, name)[i] = value
+        self.gamma_T[i] = self.gamma[i] * self.T[i]
+        self.spread_term[i] = spread_term(float(self.gamma[i]), float(self.kappa[i]))
+
+    def _refresh(self):
+        np.multiply(self.gamma, self.T, out=self.gamma_T)
+        np.divide(2.0, self.gamma, out=self.spread_term)
+        self.spread_term *= np.log1p(self.gamma / self.kappa)
+
+    def quote(self, mids, inventories, sigmas):
+        """
+        Tick-rounded (bids, asks) for arrays of mids, inventories and
+        volatilities in instrument order. The returned arrays are reused by
+        the next call; copy them to keep a result. A NaN mid (no book yet)
+        gives a NaN quote.
+        """
+        variance = np.multiply(sigmas, sigmas, out=self._variance)
+        variance *= self.gamma_T  # gamma * sigma^2 * T
+
+        skew = np.multiply(inventories, variance, out=self._skew)
+        np.subtract(mids, skew, out=skew)  # Reservation price
+
+        half_spread = np.add(variance, self.spread_term, out=self._half_spread)
+        half_spread *= 0.5
+
+        bids = np.subtract(skew, half_spread, out=self.bids)
+        bids /= self.tick_size
+        np.floor(bids, out=bids)
+        bids *= self.tick_size
+
+        asks = np.add(skew, half_spread, out=self.asks)
+        asks /= self.tick_size
+        np.ceil(asks, out=asks)
+        asks *= self.tick_size
+        return bids, asks
+
+    def quote_books(self, books, inventories, sigmas):
+        """Quote from a BookManager (or dict of books): mids are read from each book's top of book."""
+        mids = np.full(len(self.instruments), np.nan)
+        for i, name in enumerate(self.instruments):
+            book = books.get(name)
+            if book is None:
+                continue
+            best_bid, _ = book.best_bid()
+            best_ask, _ = book.best_ask()
+            if best_bid is not None and best_ask is not None:
+                mids[i] = (best_bid + best_ask) / 2
+        return self.quote(mids, inventories, sigmas)
@@ -0,0 +1,285 @@
+import asyncio
+import random
+import time
+
+import websockets
+import websockets.exceptions
+
+from asynclog import get_logger
+from rpc import RpcCorrelator
+
+log = get_logger("dbitws")
+
+TRADING = "trading"
+MARKET_DATA = "market_data"
+
+
+class Connection:
+    """
+    One websocket of a DbitWS connection pool.
+
+    Each connection has its own receive task, request correlator, tokens,
+    subscriptions, liveness watchdog and reconnect loop, so a flood of book
+    frames on one socket never delays responses on another. Received frames
+    are handed to `DbitWS.handle_frame`; settings (heartbeat interval,
+    backoff, cancel-on-disconnect) are read from the owning DbitWS.
+    """
+
+    def __init__(self, owner, name, role, url, authenticated=True):
+        self.owner = owner
+        self.name = name
+        self.role = role
+        self.url = url
+        self.authenticated = authenticated
+        self.websocket = None
+        self.rpc = RpcCorrelator()  # Request ids are per connection
+        self.access_token = None
+        self.refresh_token = None
+        self.public_channels = {}  # Subscriptions on this socket, insertion ordered (dict as ordered set)
+        self.private_channels = {}
+        self.listener_task = None
+        self.reconnect_task = None
+        self.watchdog_task = None
+        self.recv_bytes = True  # Ask websockets for undecoded frames when supported
+
+        self.last_frame_at = time.monotonic()
+        self.link_alive = False
+        self.frames = 0
+        self.reconnect_count = 0
+        self.reconnect_attempts = 0  # Failed attempts since the last full recovery, for the backoff
+        self.dead_links = 0
+        self.disconnected_at = None  # perf_counter() when the socket dropped, until recovered
+        self.last_recovery_s = None
+
+    def __repr__(self):
+        return f"Connection({self.name})"
+
+    async def open(self):
+        self.websocket = await websockets.connect(self.url)
+        # The receive loop must be running before any request can be answered
+        if self.listener_task is None or self.listener_task.done():
+            self.listener_task = asyncio.create_task(self.listen())
+        if self.authenticated:
+            await self.authenticate()
+        await self.enable_liveness()
+
+    async def request(self, method, params=None, timeout=None):
+        return await self.owner.request(method, params, timeout, connection=self)
+
+    async def send(self, text):
+        await self.websocket.send(text)
+
+    async def recv_frame(self):
+        """Receive one frame as bytes."""
+        if self.recv_bytes:
+            try:
+                return await self.websocket.recv(decode=False)
+            except TypeError:
+                self.recv_bytes = False  # websockets < 13 has no decode argument
+        frame = await self.websocket.recv()
+        return frame.encode() if isinstance(frame, str) else frame
+
+    async def listen(self):
+        owner = self.owner
+        while True:
+            try:
+                raw = await self.recv_frame()
+                received_ns = time.perf_counter_ns()
+                self.last_frame_at = time.monotonic()
+                self.frames += 1
+                if owner.recorder is not None:
+                    owner.recorder.record(raw, received_ns)
+                await owner.handle_frame(raw, received_ns, self)
+            except websockets.exceptions.ConnectionClosed:
+                log.warning("WebSocket connection %s closed. Reconnecting...", self.name)
+                self.link_alive = False
+                if self.disconnected_at is None:  # Keep the first drop if recovery is still under way
+                    self.disconnected_at = time.perf_counter()
+                self.rpc.fail_all(ConnectionError(f"WebSocket connection {self.name} closed"))
+                # The reconnect needs a fresh receive loop to get its responses, so this one exits
+                self.reconnect_task = asyncio.create_task(self.reconnect())
+                return
+            except Exception as e:
+                # One bad frame must not end the receive loop: nothing would reconnect the socket
+                log.error("Error handling frame on %s: %r", self.name, e)
+
+    async def authenticate(self):
+        timestamp, nonce, signature = self.owner.generate_signature()
+        response = await self.request("public/auth", {
+            "grant_type": "client_signature",
+            "client_id": self.owner.client_id,
+            "timestamp": timestamp,
+            "signature": signature,
+            "nonce": nonce
+        })
+
+        if 'result' in response and 'access_token' in response['result']:
+            self.access_token = response['result']['access_token']
+            self.refresh_token = response['result']['refresh_token']
+            log.info("Authentication successful on %s, access and refresh tokens saved.", self.name)
+        else:
+            log.error("Authentication failed on %s: %s", self.name, response)
+
+    async def reauthenticate(self):
+        """Exchange the refresh token for new tokens, falling back to a signed login."""
+        if self.refresh_token:
+            response = await self.request("public/auth", {
+                "grant_type": "refresh_token",
+                "refresh_token": self.refresh_token
+            })
+            if 'result' in response and 'access_token' in response['result']:
+                self.access_token = response['result']['access_token']
+                self.refresh_token = response['result']['refresh_token']
+                return
+            log.warning("Refresh token rejected on %s, signing in again: %s", self.name, response)
+        await self.authenticate()
+
+    async def subscribe(self, public_channels=None, private_channels=None):
+        """Subscribe on this socket and remember the channels for reconnects."""
+        self.public_channels.update(dict.fromkeys(public_channels or []))
+        self.private_channels.update(dict.fromkeys(private_channels or []))
+        requests = []
+        if public_channels:
+            requests.append(self.request("public/subscribe", {"channels": list(public_channels)}))
+        if private_channels:
+            if not self.access_token:
+                log.error("Access token not available on %s. Please authenticate first.", self.name)
+            else:
+                requests.append(self.request("private/subscribe", {
+                    "access_token": self.access_token,
+                    "channels": list(private_channels)
+                }))
+        return await asyncio.gather(*requests)
+
+    async def resubscribe(self):
+        """Restore all public and private subscriptions with one request each, sent together."""
+        responses = await self.subscribe(list(self.public_channels), list(self.private_channels))
+        for response in responses:
+            if 'result' not in response:
+                log.error("Resubscribe failed on %s: %s", self.name, response)
+
+    async def reconnect(self):
+        """
+        Re-open the socket with jittered exponential backoff, re-authenticate
+        with the refresh token, restore this socket's subscriptions in one
+        batch and reset the books fed by it so they are rebuilt from fresh
+        snapshots. The backoff carries over failed session restores and only
+        resets once one succeeds.
+        """
+        owner = self.owner
+        started = self.disconnected_at or time.perf_counter()
+        if self.reconnect_attempts:
+            # The last session restore failed: back off before opening the socket again
+            await asyncio.sleep(self.backoff_delay())
+        while True:
+            try:
+                self.websocket = await websockets.connect(self.url)
+                break
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                delay = self.backoff_delay()
+                self.reconnect_attempts += 1
+                log.warning("Reconnect attempt %d on %s failed (%s), retrying in %.3fs", self.reconnect_attempts, self.name, e, delay)
+                await asyncio.sleep(delay)
+
+        self.reconnect_count += 1
+        self.listener_task = asyncio.create_task(self.listen())
+
+        # Books fed by this socket are stale from here on; the resubscription snapshots rebuild them
+        for channel in self.public_channels:
+            if channel.startswith("book."):
+                owner.books.get(channel.split('.')[1]).reset()
+
+        try:
+            if self.authenticated:
+                await self.reauthenticate()
+            await asyncio.gather(self.enable_liveness(), self.resubscribe())
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            # Closing the socket hands control back to the receive loop, which reconnects again
+            log.warning("Restoring session on %s failed (%r), reconnecting", self.name, e)
+            self.reconnect_attempts += 1
+            await self.websocket.close()
+            return
+        log.info("Reconnected %s after %.3fs (%d failed attempts)", self.name, time.perf_counter() - started, self.reconnect_attempts)
+        self.reconnect_attempts = 0
+        if not any(channel.startswith("book.") for channel in self.public_channels):
+            self.recovered()  # Otherwise the first fresh book snapshot completes the recovery
+
+    def backoff_delay(self):
+        """Full jitter: anywhere between 0 and the capped exponential delay for the attempts so far."""
+        owner = self.owner
+        return random.uniform(0, min(owner.reconnect_max_delay, owner.reconnect_base_delay * 2 ** min(self.reconnect_attempts, 32)))
+
+    def recovered(self):
+        """Close out a disconnect; returns the seconds from the drop until now."""
+        self.last_recovery_s = time.perf_counter() - self.disconnected_at
+        self.disconnected_at = None
+        self.owner.last_recovery_s = self.last_recovery_s
+        return self.last_recovery_s
+
+    async def enable_liveness(self):
+        """
+        Ask the exchange for heartbeats (and test_requests when we go quiet),
+        turn on cancel-on-disconnect for the trading connection, and make sure
+        the watchdog is running. Both settings are per connection, so this
+        runs again after every reconnect.
+        """
+        owner = self.owner
+        requests = [self.request("public/set_heartbeat", {"interval": owner.heartbeat_interval})]
+        if self.role == TRADING and owner.cancel_on_disconnect and self.access_token:
+            requests.append(self.request("private/enable_cancel_on_disconnect", {"scope": "connection"}))
+        for response in await asyncio.gather(*requests):
+            if 'result' not in response:
+                log.error("Enabling liveness on %s failed: %s", self.name, response)
+
+        self.last_frame_at = time.monotonic()
+        self.link_alive = True
+        if self.watchdog_task is None or self.watchdog_task.done():
+            self.watchdog_task = asyncio.create_task(self.watchdog())
+
+    async def watchdog(self):
+        """
+        Declare the link dead when no frame (data, heartbeat or response) has
+        arrived within the liveness budget, and abort the socket so the
+        receive loop starts a reconnect instead of waiting on a half-open TCP
+        connection.
+        """
+        owner = self.owner
+        while True:
+            budget = owner.liveness_budget or owner.heartbeat_interval + 2
+            await asyncio.sleep(budget / 4)
+            if not self.link_alive or (self.reconnect_task is not None and not self.reconnect_task.done()):
+                continue
+            silence = time.monotonic() - self.last_frame_at
+            if silence <= budget:
+                continue
+
+            self.link_alive = False
+            self.dead_links += 1
+            log.warning("No frames on %s for %.1fs, dropping the connection", self.name, silence)
+            transport = getattr(self.websocket, 'transport', None)
+            if transport is not None:
+                transport.abort()  # A close handshake would wait on the dead peer
+            else:
+                await self.websocket.close()
+
+    async def close(self):
+        """Stop the tasks first so closing the socket does not trigger a reconnect."""
+        for task in (self.watchdog_task, self.reconnect_task, self.listener_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self.link_alive = False
+        self.rpc.fail_all(ConnectionError(f"WebSocket connection {self.name} closed"))
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    def stats(self):
+        return {
+            "role": self.role,
+            "frames": self.frames,
+            "in_flight": len(self.rpc),
+            "link_alive": self.link_alive,
+            "reconnects": self.reconnect_count,
+            "dead_links": self.dead_links,
+            "last_recovery_s": self.last_recovery_s,
+            "channels": len(self.public_channels) + len(self.private_channels),
+        }
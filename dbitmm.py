@@ -1,17 +1,20 @@
 import asyncio
-from dbitmm.dbitws import DbitWS
-from dbitorders import Orders
+from dbitws import DbitWS
 from event_bus import EventBus
+from ladder import LadderSpec, QuoteLadder
 
 class DBMM:
-    def __init__(self, dbit_ws, orders, event_bus):
+    def __init__(self, dbit_ws, event_bus, ladder_spec=None, max_position=100):
         self.ws = dbit_ws
-        self.orders = orders
         self.event_bus = event_bus
-        self.positions = {}  # Track positions for each instrument
+        self.positions = {}  # Position size per instrument, from user.changes
+        self.max_position = max_position  # Position at which the side adding to it stops quoting
+        self.ladder = QuoteLadder(dbit_ws, ladder_spec or LadderSpec(levels=5, base_amount=1, min_amount=1), label="dbmm")
 
         # Subscribe to market data events
         self.event_bus.subscribe("market_data", self.on_market_data)
+        # Fills: DbitWS's consumer hands these on after its own handling
+        self.ws.add_listener("user.changes.", self.on_user_changes)
 
     async def on_market_data(self, event):
         instrument_name = event["instrument_name"]
@@ -25,76 +28,39 @@ class DBMM:
         bid_quote = best_bid_price + 0.5  # Adjust as needed
         ask_quote = best_ask_price - 0.5  # Adjust as needed
 
-        # Place orders
-        await self.place_order(instrument_name, "buy", bid_quote)
-        await self.place_order(instrument_name, "sell", ask_quote)
+        await self.adjust_quotes(instrument_name, bid_quote, ask_quote)
 
-    async def place_order(self, instrument_name, direction, price):
-        amount = 1  # Example amount, adjust as needed
-        order_type = "limit"
-        time_in_force = "good_til_cancelled"
+    async def on_user_changes(self, message):
+        # The exchange sends the resulting position with every fill, so take it as is
+        for position in message['params']['data'].get('positions', []):
+            self.positions[position['instrument_name']] = position['size']
 
-        if direction == "buy":
-            response = await self.orders.place_order(
-                instrument_name=instrument_name,
-                amount=amount,
-                order_type=order_type,
-                price=price,
-                time_in_force=time_in_force
-            )
-        elif direction == "sell":
-            response = await self.orders.place_order(
-                instrument_name=instrument_name,
-                amount=amount,
-                order_type=order_type,
-                price=price,
-                time_in_force=time_in_force
-            )
-
-        # Update positions
-        if response['result']['order_state'] == 'filled':
-            if direction == "buy":
-                self.positions[instrument_name] = self.positions.get(instrument_name, 0) + amount
-            elif direction == "sell":
-                self.positions[instrument_name] = self.positions.get(instrument_name, 0) - amount
-
-        # Adjust quotes to maintain delta neutrality
-        await self.adjust_quotes(instrument_name)
-
-    async def adjust_quotes(self, instrument_name):
-        # Example logic to adjust quotes to maintain delta neutrality
+    async def adjust_quotes(self, instrument_name, bid_quote, ask_quote):
+        # Lean the ladder against the position to stay delta neutral: when long,
+        # bid sizes shrink; when short, ask sizes shrink
         position = self.positions.get(instrument_name, 0)
-        if position > 0:
-            # If long, place a sell order to reduce position
-            best_ask_price = self.ws.order_book[instrument_name]["asks"]["price"].min()
-            ask_quote = best_ask_price - 0.5  # Adjust as needed
-            await self.place_order(instrument_name, "sell", ask_quote)
-        elif position < 0:
-            # If short, place a buy order to reduce position
-            best_bid_price = self.ws.order_book[instrument_name]["bids"]["price"].max()
-            bid_quote = best_bid_price + 0.5  # Adjust as needed
-            await self.place_order(instrument_name, "buy", bid_quote)
+        lean = min(abs(position) / self.max_position, 1.0)
+        bid_scale = 1.0 - lean if position > 0 else 1.0
+        ask_scale = 1.0 - lean if position < 0 else 1.0
+        await self.ladder.quote(instrument_name, bid_quote, ask_quote, bid_scale=bid_scale, ask_scale=ask_scale)
 
 # Example usage
 async def main():
     # Create an instance of EventBus
     event_bus = EventBus()
 
-    # Create an instance of DbitWS with the event bus
-    dbit_ws = DbitWS(event_bus)
+    # Create an instance of DbitWS
+    dbit_ws = DbitWS()
     await dbit_ws.connect()
 
-    # Create an instance of Orders with the WebSocket connection and event bus
-    orders = Orders(dbit_ws, event_bus)
-
     # Create an instance of DBMM
-    market_maker = DBMM(dbit_ws, orders, event_bus)
+    market_maker = DBMM(dbit_ws, event_bus)
 
     # Define the channels to subscribe to
     channels = ["quote.BTC-9AUG24", "quote.BTC-16AUG24"]
 
-    # Subscribe to the desired channels
-    await dbit_ws.subscribe(channels)
+    # Subscribe to the desired channels, plus fills and positions for the lean
+    await dbit_ws.subscribe_channels(channels, ["user.changes.future.BTC.raw"])
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -6,25 +6,20 @@ class Orders:
         self.ws = dbit_ws
         self.event_bus = event_bus
 
-    async def place_order(self, instrument_name, amount=None, contracts=None, order_type="limit", price=None, time_in_force="good_til_cancelled", **kwargs):
-        order_message = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "private/buy" if order_type == "buy" else "private/sell",
-            "params": {
-                "instrument_name": instrument_name,
-                "type": order_type,
-                "time_in_force": time_in_force,
-                "amount": amount,
-                "price": price,
-                **kwargs
-            }
+    async def place_order(self, instrument_name, amount=None, contracts=None, order_type="limit", price=None, time_in_force="good_til_cancelled", timeout=None, **kwargs):
+        method = "private/buy" if order_type == "buy" else "private/sell"
+        params = {
+            "instrument_name": instrument_name,
+            "type": order_type,
+            "time_in_force": time_in_force,
+            "amount": amount,
+            "price": price,
+            **kwargs
         }
         if contracts is not None:
-            order_message["params"]["contracts"] = contracts
+            params["contracts"] = contracts
 
-        await self.ws.send_message(order_message)
-        response = await self.ws.message_queue.get()
+        response = await self.ws.request(method, params, timeout=timeout)
         print("Order Response:", response)
         return response
 
@@ -1,18 +1,32 @@
 import asyncio
-import websockets
 import orjson
 import hmac
 import hashlib
 import time
 import config
-from ringbuffer import volBuffer
-from bintrees import RBTree
+import websockets.exceptions
+from ringbuffer import RingBuffer
+from volatility import VolatilityEngine
 from calculations import calculate_stoikov
+from orderbook import BookManager
 from oms import PendingOrderTracker, Order
+from connection import Connection, TRADING, MARKET_DATA
+from dispatch import ChannelRouter, instrument_of
+from frames import FrameFilter
+from ingress import IngressQueue
+from asynclog import get_logger
+from latency import LatencyTracer
+from recorder import FrameRecorder
+from ratelimit import CreditLimiter, MATCHING_ENGINE_METHODS, EDIT, method_priority
 import numpy as np
-from collections import defaultdict
+from collections import Counter, defaultdict
 
+log = get_logger("dbitws")
+order_log = get_logger("dbitws.orders")
+book_log = get_logger("dbitws.book")
 
+ORDER_ENTRY_METHODS = ("private/buy", "private/sell", "private/edit")
+TEST_REPLY_ID = 0  # Request ids start at 1, so the answer to a heartbeat reply is never mistaken for one
 
 
 
@@ -21,105 +35,311 @@ class DbitWS:
         self.client_id = config.CLIENT_ID
         self.client_secret = config.CLIENT_SECRET
         self.url = config.DERIBIT_URL
-        self.websocket = None
-        self.access_token = None
-        self.refresh_token = None
-        self.order_book = RBTree()  # DataFrame to hold order book data
+        self.books = BookManager()  # One L2 book per instrument
         self.trades_df = None  # DataFrame to hold trade data
         self.current_volatility = None
-        self.volatility_buffer = volBuffer(size=30)
+        # Realized volatility per instrument from chart.trades and trades channels (see volatility.py);
+        # once warm it replaces the DVOL index as the Stoikov sigma for that instrument
+        self.volatility = VolatilityEngine()
+        self.sigma_estimator = "garman_klass"
+        self.sigma_horizon = None  # Bars; None = the longest horizon
+        self.sigma_seconds = None  # Time unit of time_horizon in seconds; None = one bar
+        self.volatility_buffer = RingBuffer(30, windows=(20,))
         self.inventory = 0
         self.instrument_details = {}
         self.order_tracker = PendingOrderTracker()
-        self.last_change_id = None  # Track the last change ID
         self.order_states = defaultdict(dict)
-        self.message_queue = asyncio.Queue()  # Create a queue for incoming messages
+        # Subscription notifications only; book and ticker updates are conflated per channel
+        self.message_queue = IngressQueue(maxsize=10000)
         self.listening = False
+        self.request_timeout = 10  # Default seconds to wait for a response
+        # Client-side model of the exchange's request credits, one pool per rate limit
+        self.order_limiter = CreditLimiter(max_credits=20, refill_rate=5, name="matching_engine")
+        self.private_limiter = CreditLimiter(max_credits=50000, refill_rate=10000, cost=500, name="non_matching_engine")
+        self.consumer_task = None
+        self.router = ChannelRouter()  # Channel -> handler dispatch table
+        self.register_routes()
+        # Handlers added by strategies; run by the same consumer after DbitWS's own, so each notification reaches both
+        self.listeners = ChannelRouter()
+        # Chatty channels can be sampled: their skipped frames are never decoded
+        self.frame_filter = FrameFilter()
+
+        # Connection pool: one authenticated socket for order entry and private
+        # channels, plus `market_data_connections` sockets for public channels,
+        # sharded by instrument (0 puts everything on the trading socket)
+        self.market_data_connections = 1
+        self.trading = None
+        self.market_data = []
+        self.shards = {}  # Instrument -> market data connection
+
+        # Reconnect state
+        self.reconnect_base_delay = 0.05  # Seconds; backoff doubles per failed attempt
+        self.reconnect_max_delay = 5.0
+        self.last_recovery_s = None  # Latest recovery of any connection (see Connection.recovered)
+
+        # Liveness
+        self.heartbeat_interval = 10  # Seconds; the exchange's minimum
+        self.liveness_budget = None  # Seconds of silence before a link is declared dead (default: interval + 2)
+        self.cancel_on_disconnect = True
+
+        # Latency tracing (nanosecond histograms per stage, see latency.py)
+        self.latency = LatencyTracer()
+        self.frame_received_ns = 0  # perf_counter_ns() of the frame being handled
+        self.last_book = None  # Book most recently changed, the tick a quote reacts to
+        self.recorder = None  # FrameRecorder, see record_frames()
+
+    def register_routes(self):
+        self.router.add_prefix("book.", self.process_order_book_message, with_instrument=True)
+        self.router.add_prefix("user.orders", self.process_user_orders)
+        self.router.add_prefix("user.changes", self.process_user_changes)
+        self.router.add_prefix("chart.trades", self.process_chart_trades_message)
+        self.router.add_prefix("trades.", self.process_trades_message, with_instrument=True)
+        self.router.add_prefix("deribit_volatility_index", self.process_volatility_index_message)
+        self.router.add_exact("user.portfolio.btc", self.process_user_portfolio)
+
+    @property
+    def connections(self):
+        return [self.trading] + self.market_data if self.trading is not None else []
+
+    @property
+    def access_token(self):
+        return self.trading.access_token if self.trading is not None else None
+
+    @property
+    def refresh_token(self):
+        return self.trading.refresh_token if self.trading is not None else None
 
     async def connect(self):
-        self.websocket = await websockets.connect(self.url)
-        await self.authenticate()
+        if self.trading is None:
+            self.trading = Connection(self, "trading", TRADING, self.url)
+            self.market_data = [
+                Connection(self, f"market_data_{i}", MARKET_DATA, self.url)
+                for i in range(self.market_data_connections)
+            ]
+        await asyncio.gather(*(connection.open() for connection in self.connections))
+
+    async def close(self):
+        if self.consumer_task is not None and not self.consumer_task.done():
+            self.consumer_task.cancel()
+        await asyncio.gather(*(connection.close() for connection in self.connections))
+        self.books.close()  # Unlinks the shared memory blocks, if the books are shared
+        if self.recorder is not None:
+            # Write out the partly filled chunk; the writer thread is joined off the loop
+            recorder, self.recorder = self.recorder, None
+            await asyncio.to_thread(recorder.close)
+
+    def market_data_for(self, key):
+        """Connection carrying public data for an instrument (or other channel key)."""
+        if not self.market_data:
+            return self.trading
+        connection = self.shards.get(key)
+        if connection is None:
+            # Sticky, least loaded first: a handful of instruments hash unevenly
+            loads = Counter(self.shards.values())
+            connection = self.shards[key] = min(self.market_data, key=lambda c: loads[c])
+        return connection
+
+    def connection_for(self, method, params):
+        """Private requests go to the trading socket; public ones for an instrument to its market data shard."""
+        if self.market_data and not method.startswith("private/") and params:
+            instrument_name = params.get('instrument_name')
+            if instrument_name is not None:
+                return self.market_data_for(instrument_name)
+        return self.trading
+
+    async def request(self, method, params=None, timeout=None, connection=None):
+        """
+        Send a JSON-RPC request and wait for its response.
+
+        Each call gets its own id, so any number of requests can be in flight
+        at once. The socket is chosen by `connection_for` unless `connection`
+        is given. Private requests first wait for credits in the matching
+        engine or non-matching engine limiter. Raises asyncio.TimeoutError if
+        no response arrives within `timeout` seconds (defaults to
+        self.request_timeout), including any time spent queued.
+        """
+        if not method.startswith("private/"):
+            return await self.send_request(method, params, timeout, connection)
+
+        if method in MATCHING_ENGINE_METHODS:
+            # Requests for the same order coalesce while queued
+            key = params.get('order_id') if params else None
+            future = self.order_limiter.submit(lambda: self.send_request(method, params, timeout, connection), method_priority(method), key)
+        else:
+            future = self.private_limiter.submit(lambda: self.send_request(method, params, timeout, connection), EDIT)
+        return await asyncio.wait_for(future, timeout or self.request_timeout)
 
-    async def authenticate(self):
-        timestamp, nonce, signature = self.generate_signature()
-        auth_message = {
+    async def send_request(self, method, params=None, timeout=None, connection=None):
+        connection = connection or self.connection_for(method, params)
+        request_id, future = connection.rpc.register()
+        msg = {
             "jsonrpc": "2.0",
-            "id": 1,
-            "method": "public/auth",
-            "params": {
-                "grant_type": "client_signature",
-                "client_id": self.client_id,
-                "timestamp": timestamp,
-                "signature": signature,
-                "nonce": nonce
-            }
+            "id": request_id,
+            "method": method,
+            "params": params or {}
+        }
+        try:
+            await self.send_message(msg, connection)
+            if not (self.latency.enabled and method in MATCHING_ENGINE_METHODS):
+                return await asyncio.wait_for(future, timeout or self.request_timeout)
+            sent = time.perf_counter_ns()
+            response = await asyncio.wait_for(future, timeout or self.request_timeout)
+            self.latency.record("ack", time.perf_counter_ns() - sent)
+            return response
+        finally:
+            connection.rpc.discard(request_id)
+
+    def configure_rate_limits(self, settings):
+        """Apply the `rate_limits` section of parameters.yaml."""
+        for name, limiter in (("matching_engine", self.order_limiter), ("non_matching_engine", self.private_limiter)):
+            limits = (settings or {}).get(name)
+            if limits:
+                limiter.configure(limits.get('max_credits'), limits.get('refill_rate'), limits.get('cost'))
+
+    def record_frames(self, directory, prefix="dbitws", **kwargs):
+        """Record every received frame to `directory` (see recorder.py); returns the recorder."""
+        self.recorder = FrameRecorder(directory, prefix=prefix, **kwargs)
+        return self.recorder
+
+    def latency_report(self):
+        """p50/p99/p99.9 per stage in nanoseconds; `self.latency.dump()` prints the same as a table."""
+        return self.latency.report()
+
+    def rate_limit_stats(self):
+        return {
+            "matching_engine": self.order_limiter.stats(),
+            "non_matching_engine": self.private_limiter.stats(),
         }
-        await self.send_message(auth_message)
-        response = await self.receive_message()
 
-        if 'result' in response and 'access_token' in response['result']:
-            self.access_token = response['result']['access_token']
-            self.refresh_token = response['result']['refresh_token']
-            print("Authentication successful, access and refresh tokens saved.")
-        else:
-            print("Authentication failed:", response)
+    def connection_stats(self):
+        return {connection.name: connection.stats() for connection in self.connections}
 
-    async def subscribe_channels(self, public_channels, private_channels):
-        # Subscribe to public channels
-        if public_channels:
-            public_msg = {
-                "jsonrpc": "2.0",
-                "method": "public/subscribe",
-                "id": 42,
-                "params": {
-                    "channels": public_channels
-                }
-            }
-            await self.send_message(public_msg)
-            print(f"Subscribed to public channels: {public_channels}")
+    async def authenticate(self):
+        await self.trading.authenticate()
 
-        # Subscribe to private channels
+    async def subscribe_channels(self, public_channels, private_channels):
+        # Pre-bind handlers so routing each notification is one dict lookup
+        self.router.bind_all(public_channels or [])
+        self.router.bind_all(private_channels or [])
+
+        # Public channels go to the market data shard of their instrument, private ones to the trading socket
+        shards = {}
+        for channel in public_channels or []:
+            key = instrument_of(channel)
+            connection = self.market_data_for(key) if key else self.trading
+            shards.setdefault(connection, []).append(channel)
+        requests = [connection.subscribe(channels) for connection, channels in shards.items()]
         if private_channels:
-            if not self.access_token:
-                print("Access token not available. Please authenticate first.")
+            requests.append(self.trading.subscribe(private_channels=private_channels))
+        for responses in await asyncio.gather(*requests):
+            for response in responses:
+                log.info("Subscribed to channels: %s", response.get('result', response))
+
+        # Start handling notifications in a separate task
+        if self.consumer_task is None or self.consumer_task.done():
+            self.consumer_task = asyncio.create_task(self.process_messages())
+
+    async def handle_frame(self, raw, received_ns, connection=None):
+        """
+        Route one raw frame. Every connection's receive loop comes through
+        here, as does the recording replay (with no connection).
+        """
+        frame_filter = self.frame_filter
+        if frame_filter.prefixes and raw.startswith(frame_filter.prefixes) and not frame_filter.should_decode(raw):
+            return  # Sampled channel: decide before paying for the decode
+
+        message = orjson.loads(raw)
+        if message.get('method') == 'subscription':
+            params = message['params']
+            name = params['channel']
+            if name.startswith("book."):
+                # Deltas can't be conflated, so the book is maintained here and
+                # consumers only get the latest "book changed" event per channel
+                if self.latency.enabled:
+                    self.latency.record("decode", time.perf_counter_ns() - received_ns)
+                    exchange_ms = params['data'].get('timestamp')
+                    if exchange_ms:
+                        # Wall clocks: includes any skew between the exchange and us
+                        self.latency.record("exchange_to_recv", time.time_ns() - exchange_ms * 1_000_000)
+                self.frame_received_ns = received_ns
+                try:
+                    await self.router.dispatch(name, message)
+                except Exception as e:
+                    log.error("Error applying book update: %r", e)
+                self.message_queue.put_nowait(message, name)
                 return
-
-            private_msg = {
-                "jsonrpc": "2.0",
-                "method": "private/subscribe",
-                "id": 43,
-                "params": {
-                    "access_token": self.access_token,
-                    "channels": private_channels
-                }
-            }
-            await self.send_message(private_msg)
-            print(f"Subscribed to private channels: {private_channels}")
-
-        # Start listening for incoming messages in a separate task
-        asyncio.create_task(self.listen_for_messages())
-
-    async def listen_for_messages(self):
+            await self.message_queue.put(message, name)
+            return
+
+        response = message
+        if connection is None:
+            # Replaying: nothing is waiting for responses, but a recorded resync
+            # snapshot is applied as it was live; anything else is dropped
+            result = response.get('result')
+            if type(result) is dict and 'change_id' in result and 'bids' in result:
+                book = self.books.books.get(result.get('instrument_name'))
+                if book is not None and book.snapshot_requested:
+                    self.apply_resync_snapshot(book, result)
+            return
+        if 'id' in response:
+            if connection.rpc.resolve(response) or response['id'] == TEST_REPLY_ID:
+                return  # Response to one of our requests
+        elif response.get('method') == 'heartbeat':
+            if response['params']['type'] == 'test_request':
+                # Answer straight away, without waiting behind anything else
+                asyncio.create_task(self.answer_test_request(connection))
+            return
+        await self.message_queue.put(response)
+
+    async def process_messages(self):
         while True:
+            message = await self.message_queue.get()
             try:
-                response = await self.websocket.recv()
-                response = orjson.loads(response)
-                await self.message_queue.put(response)  # Put the response in the queue
-            except websockets.exceptions.ConnectionClosed:
-                print("WebSocket connection closed. Reconnecting...")
-                await self.connect()
-
-    async def send_message(self, message):
+                await self.process_message(message)
+            except Exception as e:
+                log.error("Error processing message: %r", e)
+
+    async def answer_test_request(self, connection):
+        """Reply to a heartbeat test_request; nothing waits for the exchange's answer."""
+        try:
+            await self.send_message({"jsonrpc": "2.0", "id": TEST_REPLY_ID, "method": "public/test", "params": {}}, connection)
+        except websockets.exceptions.ConnectionClosed:
+            pass  # The receive loop sees the drop and reconnects
+
+    async def send_message(self, message, connection=None):
         def convert_numpy(obj):
             if isinstance(obj, np.float64):
                 return float(obj)
             raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
+        connection = connection or self.trading
+        if not self.latency.enabled:
+            await connection.send(orjson.dumps(message, default=convert_numpy).decode('utf-8'))
+            return
+
+        start = time.perf_counter_ns()
         serialized_message = orjson.dumps(message, default=convert_numpy).decode('utf-8')
-        await self.websocket.send(serialized_message)
+        serialized = time.perf_counter_ns()
+        await connection.send(serialized_message)
+        sent = time.perf_counter_ns()
+        self.latency.record("serialize", serialized - start)
+        self.latency.record("send", sent - serialized)
+
+        if message.get('method') in ORDER_ENTRY_METHODS:
+            # Tick to trade: from the book frame the quote reacted to until the order left
+            params = message.get('params', {})
+            book = self.books.books.get(params.get('instrument_name')) or self.last_book
+            if book is not None and book.received_ns:
+                self.latency.record("recv_to_send", sent - book.received_ns)
+                if book.timestamp:
+                    self.latency.record("exchange_to_send", time.time_ns() - book.timestamp * 1_000_000)
 
     async def receive_message(self):
         return await self.message_queue.get()
+
+    def ingress_stats(self):
+        """Queue depth, conflation/drop counts and message age for the notification queue."""
+        return self.message_queue.stats()
     
     
     def generate_signature(self):
@@ -131,32 +351,27 @@ class DbitWS:
         return timestamp, nonce, signature
 
 
-    async def process_message(self, message):
-        if 'id' in message:
-            if message['id'] == 888:  # Handle buy order result specifically
-                await self.handle_order_result(message)
-                return  # Exit early to avoid further processing
-
-            if message['id'] == 555:  # Handle sell order result
-                await self.handle_order_result(message)
-                return 
+    def add_listener(self, prefix, handler, with_instrument=False):
+        """
+        Call `handler(message)` for notifications on channels starting with
+        `prefix`. The notification queue has a single consumer, so this is
+        how other components see the messages DbitWS processes. Book events
+        are conflated and arrive after the book is updated; read the book
+        from `self.books`.
+        """
+        self.listeners.add_prefix(prefix, handler, with_instrument)
+        self.listeners.routes.clear()  # Rebind channels seen before this rule existed
 
+    async def process_message(self, message):
         if 'params' in message and 'data' in message['params']:
             channel = message['params']['channel']
-            if channel.startswith("book."):
-                await self.process_order_book_message(message)
-            elif channel.startswith("user.orders"):
-                await self.process_user_orders(message)  # Add this line
-            elif channel.startswith("user.changes"):
-                await self.process_user_changes(message)
-            elif channel.startswith("chart.trades"):
-                await self.process_chart_trades_message(message)
-            elif channel.startswith("deribit_volatility_index"):
-                await self.process_volatility_index_message(message)
-            elif channel == "user.portfolio.btc":  # Handle portfolio data
-                await self.process_user_portfolio(message)
+            if not channel.startswith("book."):  # Book updates are already applied on the receive path
+                await self.router.dispatch(channel, message)
         else:
-            print("Received message without 'method':", message)  # Log unexpected messages
+            log.warning("Received message without 'method': %s", message)  # Log unexpected messages
+            return
+        if self.listeners.prefixes:
+            await self.listeners.dispatch(channel, message)
 
     async def process_user_orders(self, message):
         if 'params' in message and 'data' in message['params']:
@@ -164,7 +379,7 @@ class DbitWS:
             order_id = data['order_id']
             instrument_name = data['instrument_name']
             self.order_states[instrument_name][order_id] = data
-            print(f"Updated order state: {data}")
+            order_log.debug("Updated order state: %s", data)
 
 
     async def get_order_state(self, instrument_name, order_id):
@@ -172,7 +387,7 @@ class DbitWS:
         if order_id in self.order_states[instrument_name]:
             return self.order_states[instrument_name][order_id]
         else:
-            print(f"Order state not found for order ID: {order_id}")
+            order_log.debug("Order state not found for order ID: %s", order_id)
             return None
 
 
@@ -183,12 +398,12 @@ class DbitWS:
             order_id = data['order_id']
             instrument_name = data['instrument_name']
             self.order_states[instrument_name][order_id] = data
-            print(f"Updated order state: {data}")
+            order_log.debug("Updated order state: %s", data)
 
 
 
     async def process_user_portfolio(self, message):
-        print("Processing user portfolio message:", message)
+        log.debug("Processing user portfolio message: %s", message)
         if 'params' in message and 'data' in message['params']:
             data = message['params']['data']
 
@@ -208,8 +423,7 @@ class DbitWS:
             # Store available funds for market making
             self.inventory = self.portfolio_data["available_funds"]
 
-            print("Updated Portfolio Data:")
-            print(self.portfolio_data)
+            log.info("Updated Portfolio Data: %s", self.portfolio_data)
 
             return self.portfolio_data  # Return the portfolio data
         return None  # Return None if the data is not available
@@ -223,48 +437,35 @@ class DbitWS:
             timestamp = data.get('timestamp')
             index_name = data.get('index_name')
 
-            # Add the new volatility value to the ring buffer
-            self.volatility_buffer.add(volatility)
+            if volatility is None:
+                return
 
-            # Print the current average volatility
-            avg_volatility = self.volatility_buffer.average()
-            #print(f"Current Average Volatility: {avg_volatility}")
+            # Add the new volatility value to the ring buffer; mean and bands are updated in O(1)
+            self.volatility_buffer.append(volatility)
 
             # Calculate Bollinger Bands
             mean, upper_band, lower_band = self.volatility_buffer.bollinger_bands(period=20, num_std_dev=2)
-            if mean is not None:
-                None
-            else:
-                print(f"waiting for buffer to fill to calclulate mean and bands. Current vol: {volatility}")
+            if mean is None:
+                log.debug("waiting for buffer to fill to calclulate mean and bands. Current vol: %s", volatility)
 
 
     async def get_historical_volatility(self, currency):
-        msg = {
-            "jsonrpc": "2.0",
-            "id": 8387,  # Unique ID for the request
-            "method": "public/get_historical_volatility",
-            "params": {
-                "currency": currency
-            }
-        }
-
-        await self.send_message(msg)  # Send the request message
-        response = await self.receive_message()  # Wait for the response
+        response = await self.request("public/get_historical_volatility", {"currency": currency})
 
         # Debugging output
-        print("Response from get_historical_volatility:", response)
+        log.debug("Response from get_historical_volatility: %s", response)
 
         # Check if the response contains the result
         if 'result' in response:
             historical_volatility = response['result']  # Get the result array
             return historical_volatility  # Return the list of lists directly
         else:
-            print("Error retrieving historical volatility:", response)
+            log.error("Error retrieving historical volatility: %s", response)
             return None  # Return None or handle the error as needed
 
 
     async def process_chart_trades_message(self, message):
-        print("Processing chart trades message:", message)
+        log.debug("Processing chart trades message: %s", message)
         if 'params' in message and 'data' in message['params']:
             data = message['params']['data']
             volume = data.get('volume')
@@ -286,15 +487,23 @@ class DbitWS:
                 "cost": cost
             }
 
-            # Add the new trade to the ring buffer
-            self.chart_trade_buffer.add(new_trade)
-
-            print("Updated Chart Trades Ring Buffer:")
-            print(self.chart_trade_buffer.get_all())  # Print all trades in the buffer
+            # A new tick closes the previous bar and updates the realized volatility estimators
+            if self.volatility.on_chart_trades(message['params']['channel'], data):
+                log.debug("Closed bar for %s: %s", message['params']['channel'], new_trade)
 
             # Return the processed trade data for further calculations
             return new_trade
 
+    async def process_trades_message(self, message, instrument=None):
+        trades = message.get('params', {}).get('data')
+        if trades:
+            self.volatility.on_trades(instrument, trades)
+
+    def instrument_sigma(self, instrument_name):
+        """Stoikov sigma for an instrument: realized volatility in price units once available, else the DVOL index."""
+        sigma = self.volatility.price_sigma(instrument_name, self.sigma_estimator, self.sigma_horizon, self.sigma_seconds)
+        return sigma if sigma is not None else self.current_volatility
+
     async def process_user_changes(self, message):
         if 'params' in message and 'data' in message['params']:
             data = message['params']['data']
@@ -308,7 +517,7 @@ class DbitWS:
 
             # Process trades
             for trade in trades:
-                print(f"Trade ID: {trade['trade_id']}, Price: {trade['price']}, Amount: {trade['amount']}, Direction: {trade['direction']}, instrument name: {trade['instrument_name']}")
+                order_log.info("Trade ID: %s, Price: %s, Amount: %s, Direction: %s, instrument name: %s", trade['trade_id'], trade['price'], trade['amount'], trade['direction'], trade['instrument_name'])
                 return {
                     "trade_id": trade['trade_id'],
                     "price": trade['price'],
@@ -319,7 +528,7 @@ class DbitWS:
 
             # Process positions
             for position in positions:
-                print(f"Position for {instrument_name}: Size: {position['size']}, Total P&L: {position['total_profit_loss']}")
+                order_log.info("Position for %s: Size: %s, Total P&L: %s", instrument_name, position['size'], position['total_profit_loss'])
                 return {
                     "size": position['size'],
                     "total_profit_loss": position['total_profit_loss'],
@@ -341,11 +550,11 @@ class DbitWS:
                 # Update the order in the tracker
                 if state in ['open', 'filled', 'cancelled']:  # Adjust based on your order states
                     self.order_tracker.add_order(order_obj)
-                    print(f"Order added to tracker: {order_obj}")
+                    order_log.debug("Order added to tracker: %s", order_obj)
                 else:
                     # If the order is no longer valid, remove it from the tracker
                     self.order_tracker.remove_order(order_id)
-                    print(f"Order removed from tracker: {order_id}")
+                    order_log.debug("Order removed from tracker: %s", order_id)
 
                 return {
                     "order_id": order_id,
@@ -355,128 +564,140 @@ class DbitWS:
                     "instrument_name": instrument_name
                 }
 
-    async def process_order_book_message(self, message):
+    async def process_order_book_message(self, message, instrument=None):
         if 'params' in message and 'data' in message['params']:
             data = message['params']['data']
-            channel = message['params']['channel']
-
-            if channel.startswith("book."):
-                if data['type'] == "snapshot":
-                    # Initialize the RBTree with the full order book
-                    bids = data['bids']
-                    asks = data['asks']
-                    self.order_book.clear()  # Clear existing order book
-
-                    for bid in bids:
-                        price, amount = bid[1], bid[2]
-                        self.order_book.insert(price, ('bid', amount))  # Insert bids
-
-                    for ask in asks:
-                        price, amount = ask[1], ask[2]
-                        self.order_book.insert(price, ('ask', amount))  # Insert asks
-
-                    self.last_change_id = data['change_id']
-                    #print("Order Book Snapshot:")
-                    #print(self.order_book)  # Print the order book
-
-                elif data['type'] == "change":
-                    change_id = data['change_id']
-                    prev_change_id = data.get('prev_change_id')
-
-                    if prev_change_id == self.last_change_id:
-                        # Process changes
-                        for action, price, amount in data['bids']:
-                            if action == "delete":
-                                if price in self.order_book:
-                                    del self.order_book[price]  # Remove bid
-                            else:  # "new" or "change"
-                                self.order_book.insert(price, ('bid', amount))  # Update or insert bid
-
-                        for action, price, amount in data['asks']:
-                            if action == "delete":
-                                if price in self.order_book:
-                                    del self.order_book[price]  # Remove ask
-                            else:  # "new" or "change"
-                                self.order_book.insert(price, ('ask', amount))  # Update or insert ask
-
-                        self.last_change_id = change_id
-                        #print(f"Updated Order Book: {self.order_book}") 
-                        mid_price, spread, best_bid, best_ask, optimal_bid, optimal_ask = calculate_stoikov(
-                            self.order_book, 
-                            self.inventory,
-                            self.current_volatility, 
-                            self.risk_aversion,
-                            self.time_horizon,  # Pass the time_horizon value from the DbitWS instance
-                            tick_size=2.5
-                        )
-                        return self.order_book
-
-    async def place_buy(self, instrument_name, amount, order_type, label, price=None, post_only=True):
-        msg = {
-            "jsonrpc": "2.0",
-            "id": 888,  # You can generate a unique ID for each order
-            "method": "private/buy",
-            "params": {
+            # The router pre-binds the instrument; fall back to parsing the channel
+            book = self.books.get(instrument) if instrument is not None else self.books.route(message['params']['channel'])
+            return await self.apply_book_update(
+                book,
+                data['type'],
+                data['bids'],
+                data['asks'],
+                data['change_id'],
+                data.get('prev_change_id'),
+                data.get('timestamp')
+            )
+
+    async def apply_book_update(self, book, update_type, bids, asks, change_id, prev_change_id, timestamp):
+        if update_type == "snapshot":
+            # Replace the book with the full snapshot
+            book.apply_snapshot(bids, asks, change_id, timestamp)
+            self.books.publish(book)
+            connection = self.shards.get(book.instrument_name) or self.trading
+            if connection is not None and connection.disconnected_at is not None:
+                book_log.info("First fresh book on %s %.1f ms after disconnect", connection.name, connection.recovered() * 1000)
+
+        elif update_type == "change":
+            start = time.perf_counter_ns()
+            if book.apply_change(bids, asks, change_id, prev_change_id, timestamp):
+                applied = time.perf_counter_ns()
+                self.books.publish(book)
+                book.quote = calculate_stoikov(
+                    book,
+                    self.inventory,
+                    self.instrument_sigma(book.instrument_name),
+                    self.risk_aversion,
+                    self.time_horizon,  # Pass the time_horizon value from the DbitWS instance
+                    tick_size=self.instrument_details.get(book.instrument_name, {}).get('tick_size', 2.5)
+                )
+                book.received_ns = self.frame_received_ns
+                self.last_book = book
+                if self.latency.enabled:
+                    quoted = time.perf_counter_ns()
+                    self.latency.record("book_apply", applied - start)
+                    self.latency.record("stoikov", quoted - applied)
+                    if self.frame_received_ns:
+                        self.latency.record("recv_to_quote", quoted - self.frame_received_ns)
+                return book
+
+            if book.needs_snapshot:
+                # Sequence gap: deltas are buffered by the book until a fresh snapshot arrives
+                book.snapshot_requested = True
+                asyncio.create_task(self.resync_book(book.instrument_name))
+
+    async def resync_book(self, instrument_name, depth=10000):
+        book = self.books.get(instrument_name)
+        book_log.warning("Order book gap detected for %s, requesting snapshot (gaps: %d)", instrument_name, book.gap_count)
+        if self.trading is None:
+            # Not connected, i.e. replaying a recording: the recorded get_order_book
+            # response brings the snapshot, so the request stays outstanding
+            return
+        try:
+            response = await self.request("public/get_order_book", {
                 "instrument_name": instrument_name,
-                "amount": amount,
-                "type": order_type,
-                "label": label
-            }
+                "depth": depth
+            })
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            response = {"error": repr(e)}
+
+        result = response.get('result')
+        if not result:
+            book_log.error("Error retrieving order book snapshot: %s", response)
+            book.snapshot_requested = False  # Retry on the next change
+            return
+        self.apply_resync_snapshot(book, result)
+
+    def apply_resync_snapshot(self, book, result):
+        """Load a get_order_book result into a book and replay the deltas buffered meanwhile."""
+        book.apply_snapshot(result['bids'], result['asks'], result['change_id'], result.get('timestamp'))
+        if not book.resyncing:
+            self.books.publish(book)
+            book_log.info("Order book for %s resynced in %.2f ms", book.instrument_name, book.last_recovery_ms)
+
+    async def place_buy(self, instrument_name, amount, order_type, label, price=None, post_only=True, timeout=None):
+        return await self.place_order("private/buy", instrument_name, amount, order_type, label, price, post_only, timeout)
+
+    async def place_sell(self, instrument_name, amount, order_type, label, price=None, post_only=True, timeout=None):
+        return await self.place_order("private/sell", instrument_name, amount, order_type, label, price, post_only, timeout)
+
+    async def place_order(self, method, instrument_name, amount, order_type, label, price=None, post_only=True, timeout=None):
+        params = {
+            "instrument_name": instrument_name,
+            "amount": amount,
+            "type": order_type,
+            "label": label
         }
-        
-        if order_type == "limit" and price is not None:
-            msg["params"]["price"] = price
-            msg["params"]["post_only"] = post_only
-
-        await self.send_message(msg)
-        response = await self.receive_message()
-        order_id = response.get('result', {}).get('order', {}).get('order_id')
-        print(f"Order placed: {msg}, Order ID: {order_id}")
-        return order_id
 
-
-    async def place_sell(self, instrument_name, amount, order_type, label, price=None, post_only=True):
-        msg = {
-            "jsonrpc": "2.0",
-            "id": 555,  # You can generate a unique ID for each order
-            "method": "private/sell",
-            "params": {
-                "instrument_name": instrument_name,
-                "amount": amount,
-                "type": order_type,
-                "label": label
-            }
-        }
-    
         if order_type == "limit" and price is not None:
-            msg["params"]["price"] = price
-            msg["params"]["post_only"] = post_only
+            params["price"] = price
+            params["post_only"] = post_only
 
-        await self.send_message(msg)
-        response = await self.receive_message()
+        response = await self.request(method, params, timeout=timeout)
+        await self.handle_order_result(response)
         order_id = response.get('result', {}).get('order', {}).get('order_id')
-        print(f"Order placed: {msg}, Order ID: {order_id}")
+        order_log.info("Order placed: %s %s, Order ID: %s", method, params, order_id)
         return order_id
-        
-    
-    
-    
-    async def cancel_all_orders(self):
-        msg = {
-            "jsonrpc": "2.0",
-            "id": 444,  # You can generate a unique ID for each order
-            "method": "private/cancel_all",
-            "params": {}
-        }
 
-        await self.send_message(msg)
-        print(f"Cancelling all orders: {msg}")
+    async def cancel_all_orders(self, instrument_name=None, timeout=None):
+        if instrument_name is not None:
+            method, params = "private/cancel_all_by_instrument", {"instrument_name": instrument_name}
+        else:
+            method, params = "private/cancel_all", {}
+        order_log.info("Cancelling all orders: %s %s", method, params)
 
         # Wait for the response
-        response = await self.receive_message()
-        print("Response from cancel all orders:", response)
-
-
+        response = await self.request(method, params, timeout=timeout)
+        order_log.info("Response from cancel all orders: %s", response)
+        return response
+
+    async def edit_order(self, order_id, amount, price, post_only=True, timeout=None):
+        """Move a resting order in place, keeping its order_id (and queue position if only the amount shrinks)."""
+        return await self.request("private/edit", {
+            "order_id": order_id,
+            "amount": amount,
+            "price": price,
+            "post_only": post_only
+        }, timeout=timeout)
+
+    async def cancel_order(self, order_id, timeout=None):
+        return await self.request("private/cancel", {"order_id": order_id}, timeout=timeout)
+
+    async def cancel_by_label(self, label, currency=None, timeout=None):
+        params = {"label": label}
+        if currency is not None:
+            params["currency"] = currency
+        return await self.request("private/cancel_by_label", params, timeout=timeout)
 
     async def handle_order_result(self, message):
         order_data = message.get('result', {}).get('order', {})
@@ -505,12 +726,12 @@ class DbitWS:
                 "label": label
             }
 
-            # Track pending orders based on the message ID
-            if message.get('id') == 888:  # Buy order
+            # Track pending orders based on the order direction
+            if side == 'buy':
                 self.order_tracker.add_order(order)  # Add to tracker for buy orders
-                print(f"Pending Buy Order added: {order}, Details: {order_details}")
-            elif message.get('id') == 555:  # Sell order
+                order_log.debug("Pending Buy Order added: %s, Details: %s", order, order_details)
+            elif side == 'sell':
                 self.order_tracker.add_order(order)  # Add to tracker for sell orders
-                print(f"Pending Sell Order added: {order}, Details: {order_details}")
+                order_log.debug("Pending Sell Order added: %s, Details: %s", order, order_details)
             else:
-                print(f"Unknown order ID: {message.get('id')}. Cannot determine order type.")
\ No newline at end of file
+                order_log.warning("Unknown order direction: %s. Cannot determine order type.", side)
\ No newline at end of file
@@ -0,0 +1,127 @@
+import time
+from functools import partial
+
+# Dotted position of the instrument (or index) name, for channel families named with more than one word
+INSTRUMENT_POSITIONS = (("chart.trades.", 2), ("markprice.options.", 2), ("user.", 2))
+
+
+def instrument_of(channel):
+    """
+    Instrument (or index) a channel is about: book.BTC-PERPETUAL.raw and
+    chart.trades.BTC-PERPETUAL.1 both give BTC-PERPETUAL. None for channels
+    without one.
+    """
+    position = 1
+    for prefix, index in INSTRUMENT_POSITIONS:
+        if channel.startswith(prefix):
+            position = index
+            break
+    parts = channel.split('.')
+    return parts[position] if len(parts) > position else None
+
+
+class ChannelStats:
+    __slots__ = ("count", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_us": self.total_ns / self.count / 1e3 if self.count else 0.0,
+            "max_us": self.max_ns / 1e3,
+        }
+
+
+class ChannelRouter:
+    """
+    Exact-channel dispatch table for subscription notifications.
+
+    Rules (exact channel names or prefixes) are registered once; each concrete
+    channel is bound to a pre-built handler the first time it is seen (or up
+    front via `bind`, when subscriptions are created), so routing a message
+    is a single dict lookup; channels no rule matches are cached too, so they
+    cost one lookup as well. Handlers registered with `with_instrument=True`
+    are bound with instrument=instrument_of(channel).
+    Message count and handler time are tracked per channel.
+    """
+
+    def __init__(self):
+        self.exact = {}  # Channel -> (handler, with_instrument)
+        self.prefixes = []  # [(prefix, handler, with_instrument)], first match wins
+        self.routes = {}  # Channel -> (bound handler, ChannelStats), or None if no rule matches
+
+    def add_exact(self, channel, handler, with_instrument=False):
+        self.exact[channel] = (handler, with_instrument)
+        self._forget_misses()
+
+    def add_prefix(self, prefix, handler, with_instrument=False):
+        self.prefixes.append((prefix, handler, with_instrument))
+        self._forget_misses()
+
+    def _forget_misses(self):
+        """A new rule may match channels that had none."""
+        self.routes = {channel: route for channel, route in self.routes.items() if route is not None}
+
+    def _rule(self, channel):
+        rule = self.exact.get(channel)
+        if rule is not None:
+            return rule
+        for prefix, handler, with_instrument in self.prefixes:
+            if channel.startswith(prefix):
+                return handler, with_instrument
+        return None
+
+    def bind(self, channel):
+        """Resolve and cache the handler for a channel; returns None if no rule matches."""
+        route = self.routes.get(channel, False)
+        if route is not False:
+            return route
+        rule = self._rule(channel)
+        if rule is None:
+            self.routes[channel] = None
+            return None
+        handler, with_instrument = rule
+        if with_instrument:
+            handler = partial(handler, instrument=instrument_of(channel))
+        route = (handler, ChannelStats())
+        self.routes[channel] = route
+        return route
+
+    def bind_all(self, channels):
+        for channel in channels:
+            self.bind(channel)
+
+    def unbind(self, channel):
+        self.routes.pop(channel, None)
+
+    async def dispatch(self, channel, message):
+        """Run the handler bound to `channel`; returns False if nothing handles it."""
+        route = self.routes.get(channel, False)
+        if route is False:
+            route = self.bind(channel)
+        if route is None:
+            return False
+        handler, stats = route
+        start = time.perf_counter_ns()
+        await handler(message)
+        elapsed = time.perf_counter_ns() - start
+        stats.count += 1
+        stats.total_ns += elapsed
+        if elapsed > stats.max_ns:
+            stats.max_ns = elapsed
+        return True
+
+    def report(self):
+        """Per-channel counters, busiest channels first."""
+        return {
+            channel: stats.as_dict()
+            for channel, (_, stats) in sorted(
+                ((channel, route) for channel, route in self.routes.items() if route is not None),
+                key=lambda item: -item[1][1].total_ns
+            )
+        }
@@ -0,0 +1,49 @@
+# Deribit serialises every notification with the same leading bytes
+NOTIFICATION_PREFIX = b'{"jsonrpc":"2.0","method":"subscription","params":{"channel":"'
+
+
+class FrameFilter:
+    """
+    Decode only one frame in `every` for sampled channels (0 drops them).
+
+    Sampled channels are recognised on the raw frame, before any decoding,
+    by one `startswith` over the precomputed leading bytes of their
+    notifications. Frames of any other channel (and responses) cost that
+    single check and nothing else; with nothing sampled `prefixes` is empty
+    and callers skip the check altogether. Book and chart.trades channels
+    must not be sampled: a skipped delta forces a resync and a skipped candle
+    loses a bar.
+    """
+
+    def __init__(self):
+        self.sampling = {}  # Channel -> decode one frame in N (0 = drop)
+        self.prefixes = ()  # Leading bytes of each sampled channel's notifications
+        self.every = {}  # Channel bytes -> N
+        self.seen = {}  # Channel bytes -> frames seen
+        self.skipped = 0
+
+    def sample(self, channel, every):
+        if channel.startswith(("book.", "chart.trades")):
+            raise ValueError(f"{channel} can't be sampled")
+        self.sampling[channel] = every
+        self.every = {name.encode(): n for name, n in self.sampling.items()}
+        # The closing quote keeps "ticker.X" from matching "ticker.X-PERPETUAL"
+        self.prefixes = tuple(NOTIFICATION_PREFIX + name + b'"' for name in self.every)
+
+    def should_decode(self, raw):
+        """For a frame that matched `prefixes`: whether it is the one in N to decode."""
+        start = len(NOTIFICATION_PREFIX)
+        channel = raw[start:raw.index(b'"', start)]
+        seen = self.seen.get(channel, 0) + 1
+        self.seen[channel] = seen
+        every = self.every[channel]
+        if every == 0 or seen % every:
+            self.skipped += 1
+            return False
+        return True
+
+    def report(self):
+        return {
+            "skipped": self.skipped,
+            "seen": {channel.decode(): seen for channel, seen in self.seen.items()},
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import deque
+
+LOSSLESS = "lossless"  # Never dropped; producers wait when the queue is full
+CONFLATE = "conflate"  # One pending entry per channel, replaced by the newest message
+DROP = "drop"  # Dropped (and counted) when the queue is full
+
+DEFAULT_POLICIES = (
+    ("book.", CONFLATE),
+    ("ticker.", CONFLATE),
+    ("quote.", CONFLATE),
+    ("deribit_volatility_index", CONFLATE),
+    ("chart.trades", LOSSLESS),  # Candles feed the volatility bars; a dropped update loses a bar
+)
+
+
+class IngressQueue:
+    """
+    Bounded queue between the receive loop and the strategy.
+
+    Each channel class has a policy (see DEFAULT_POLICIES; anything else,
+    including order and trade events, is LOSSLESS). A conflated message keeps
+    the queue position of the first pending update for its channel but carries
+    the latest state, so a slow consumer always sees the freshest book or
+    ticker and the queue can never hold more than one entry per such channel.
+    Depth, conflation/drop counts and message age at dequeue are tracked.
+    """
+
+    def __init__(self, maxsize=10000, policies=DEFAULT_POLICIES):
+        self.maxsize = maxsize
+        self.policies = list(policies)
+        self.channel_policies = {}  # Channel -> policy, resolved on first sight
+        self.entries = deque()  # [channel, message, enqueued_at]
+        self.pending = {}  # Channel -> entry, for conflated channels
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+
+        self.conflated = 0
+        self.dropped = 0
+        self.blocked_puts = 0
+        self.max_depth = 0
+        self.last_age = 0.0  # Seconds a message waited before being taken
+        self.max_age = 0.0
+
+    def qsize(self):
+        return len(self.entries)
+
+    def empty(self):
+        return not self.entries
+
+    def policy(self, channel):
+        policy = self.channel_policies.get(channel)
+        if policy is None:
+            policy = LOSSLESS
+            for prefix, candidate in self.policies:
+                if channel.startswith(prefix):
+                    policy = candidate
+                    break
+            self.channel_policies[channel] = policy
+        return policy
+
+    def _append(self, channel, message):
+        entry = [channel, message, time.perf_counter()]
+        self.entries.append(entry)
+        depth = len(self.entries)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if depth >= self.maxsize:
+            self.not_full.clear()
+        self.not_empty.set()
+        return entry
+
+    def put_nowait(self, message, channel=None):
+        """
+        Enqueue without waiting. Returns False if a LOSSLESS message could not
+        be queued because the queue is full (use `put` to wait instead).
+        """
+        if channel is None:
+            return self._put_lossless(message)
+
+        policy = self.policy(channel)
+        if policy == CONFLATE:
+            entry = self.pending.get(channel)
+            if entry is not None:
+                entry[1] = message
+                self.conflated += 1
+                return True
+            # Conflated channels are bounded by the number of channels, not maxsize
+            self.pending[channel] = self._append(channel, message)
+            return True
+
+        if policy == DROP:
+            if len(self.entries) >= self.maxsize:
+                self.dropped += 1
+                return True
+            self._append(channel, message)
+            return True
+
+        return self._put_lossless(message, channel)
+
+    def _put_lossless(self, message, channel=None):
+        if len(self.entries) >= self.maxsize:
+            return False
+        self._append(channel, message)
+        return True
+
+    async def put(self, message, channel=None):
+        while not self.put_nowait(message, channel):
+            self.blocked_puts += 1
+            await self.not_full.wait()
+
+    def get_nowait(self):
+        if not self.entries:
+            raise asyncio.QueueEmpty
+        entry = self.entries.popleft()
+        channel, message, enqueued_at = entry
+        if channel is not None and self.pending.get(channel) is entry:
+            del self.pending[channel]
+        if not self.entries:
+            self.not_empty.clear()
+        if len(self.entries) < self.maxsize:
+            self.not_full.set()
+
+        age = time.perf_counter() - enqueued_at
+        self.last_age = age
+        if age > self.max_age:
+            self.max_age = age
+        return message
+
+    async def get(self):
+        while not self.entries:
+            await self.not_empty.wait()
+        return self.get_nowait()
+
+    def stats(self):
+        return {
+            "depth": len(self.entries),
+            "max_depth": self.max_depth,
+            "conflated": self.conflated,
+            "dropped": self.dropped,
+            "blocked_puts": self.blocked_puts,
+            "last_age_ms": self.last_age * 1000.0,
+            "max_age_ms": self.max_age * 1000.0,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from asynclog import get_logger
+from quotes import CLOSED_STATES, NOT_OPEN_ORDER, LiveQuote
+
+log = get_logger("quotes")
+
+
+class LadderSpec:
+    """
+    Shape of a quote ladder: `levels` orders per side, `spacing` ticks apart,
+    the first one `offset` ticks away from the model quote. Level i is sized
+    base_amount * growth**i, rounded down to a multiple of `min_amount`.
+    Offsets and sizes only depend on these parameters, so they are computed
+    once as arrays and reused for every requote.
+    """
+
+    def __init__(self, levels=5, spacing=1, offset=0, base_amount=10, growth=1.0, min_amount=10):
+        self.levels = levels
+        self.spacing = spacing
+        self.offset = offset
+        self.min_amount = min_amount
+        index = np.arange(levels)
+        self.offset_ticks = offset + index * spacing
+        sizes = base_amount * growth ** index
+        self.sizes = np.maximum(np.floor(sizes / min_amount), 1) * min_amount
+
+    def prices(self, bid, ask, tick_size):
+        """Tick-aligned bid and ask price arrays, best level first."""
+        offsets = self.offset_ticks * tick_size
+        bids = np.floor((bid - offsets) / tick_size) * tick_size
+        asks = np.ceil((ask + offsets) / tick_size) * tick_size
+        return bids, asks
+
+    def amounts(self, scale=1.0):
+        """Level sizes scaled by `scale` (0 takes the side down), still in multiples of min_amount."""
+        if scale == 1.0:
+            return self.sizes
+        return np.floor(self.sizes * scale / self.min_amount) * self.min_amount
+
+
+class QuoteLadder:
+    """
+    Keeps an N-level ladder per side per instrument from one model quote.
+
+    A requote matches the target levels against the live orders of each side:
+    live orders already at a target price are kept (or have their amount
+    edited), the remaining live orders are edited onto the remaining target
+    prices, and only the surplus is placed or cancelled. Every request for
+    both sides goes out in one concurrent batch, so a requote takes about one
+    round trip regardless of the number of levels. All orders of a ladder
+    share one label, so `clear` removes it with a single private/cancel_by_label.
+    """
+
+    def __init__(self, ws, spec=None, label="ladder", post_only=True):
+        self.ws = ws
+        self.spec = spec or LadderSpec()
+        self.label = label
+        self.post_only = post_only
+        self.live = {}  # (instrument, side) -> [LiveQuote]
+
+        # Requote metrics
+        self.requotes = 0
+        self.actions = Counter()  # "keep" / "edit" / "place" / "cancel" / "replace"
+        self.requests = 0
+        self.latencies = deque(maxlen=1000)  # Seconds per requote
+
+    def ladder_label(self, instrument_name):
+        return f"{self.label}_{instrument_name}"
+
+    def orders(self, instrument_name, side):
+        """Live orders for one side, minus any the user.orders channel reported as closed."""
+        live = self.live.get((instrument_name, side))
+        if not live:
+            return []
+        states = self.ws.order_states[instrument_name]
+        open_orders = [
+            quote for quote in live
+            if states.get(quote.order_id, {}).get('order_state') not in CLOSED_STATES
+        ]
+        if len(open_orders) != len(live):
+            self.live[(instrument_name, side)] = open_orders
+        return open_orders
+
+    async def quote(self, instrument_name, bid, ask, tick_size=None, bid_scale=1.0, ask_scale=1.0):
+        """
+        Move the ladder for an instrument to quotes around `bid` / `ask`.
+        `bid_scale` / `ask_scale` scale the level sizes, e.g. to lean against
+        inventory. Returns the number of requests sent.
+        """
+        if tick_size is None:
+            tick_size = self.ws.instrument_details.get(instrument_name, {}).get('tick_size', 0.5)
+        bid_prices, ask_prices = self.spec.prices(bid, ask, tick_size)
+        bid_amounts = self.spec.amounts(bid_scale)
+        ask_amounts = self.spec.amounts(ask_scale)
+
+        start = time.perf_counter()
+        requests = []
+        requests += self.plan(instrument_name, "buy", bid_prices.tolist(), bid_amounts.tolist())
+        requests += self.plan(instrument_name, "sell", ask_prices.tolist(), ask_amounts.tolist())
+        if requests:
+            await asyncio.gather(*requests)
+
+        self.requotes += 1
+        self.requests += len(requests)
+        self.latencies.append(time.perf_counter() - start)
+        return len(requests)
+
+    def plan(self, instrument_name, side, prices, amounts):
+        """Diff one side against its target levels and return the coroutines that reconcile it."""
+        targets = {price: amount for price, amount in zip(prices, amounts) if amount > 0}
+        live = self.orders(instrument_name, side)
+        kept = []
+        spare = []
+        requests = []
+
+        # Orders already resting at a target price keep their queue position
+        for quote in live:
+            amount = targets.pop(quote.price, None)
+            if amount is None:
+                spare.append(quote)
+                continue
+            kept.append(quote)
+            if amount == quote.amount:
+                self.actions["keep"] += 1
+            else:
+                self.actions["edit"] += 1
+                requests.append(self.edit(instrument_name, side, quote, quote.price, amount))
+
+        remaining = list(targets.items())
+        for quote, (price, amount) in zip(spare, remaining):
+            kept.append(quote)
+            self.actions["edit"] += 1
+            requests.append(self.edit(instrument_name, side, quote, price, amount))
+        for price, amount in remaining[len(spare):]:
+            self.actions["place"] += 1
+            requests.append(self.place(instrument_name, side, price, amount))
+        for quote in spare[len(remaining):]:
+            self.actions["cancel"] += 1
+            requests.append(self.ws.cancel_order(quote.order_id))
+
+        self.live[(instrument_name, side)] = kept
+        return requests
+
+    async def edit(self, instrument_name, side, quote, price, amount):
+        response = await self.ws.edit_order(quote.order_id, amount, price, post_only=self.post_only)
+        if 'result' in response:
+            quote.price = price
+            quote.amount = amount
+            return
+        live = self.live.get((instrument_name, side), [])
+        if quote in live:
+            live.remove(quote)
+        if response.get('error', {}).get('code') != NOT_OPEN_ORDER:
+            log.warning("Ladder edit failed for %s %s: %s", instrument_name, side, response)
+            return
+        # Filled or cancelled before the edit arrived: place the level again
+        self.actions["replace"] += 1
+        self.requests += 1
+        await self.place(instrument_name, side, price, amount)
+
+    async def place(self, instrument_name, side, price, amount):
+        label = self.ladder_label(instrument_name)
+        method = self.ws.place_buy if side == "buy" else self.ws.place_sell
+        order_id = await method(instrument_name, amount, "limit", label, price=price, post_only=self.post_only)
+        if order_id is not None:
+            self.live.setdefault((instrument_name, side), []).append(LiveQuote(order_id, price, amount, label))
+
+    async def clear(self, instrument_name):
+        """Cancel the whole ladder for an instrument with one request."""
+        self.live.pop((instrument_name, "buy"), None)
+        self.live.pop((instrument_name, "sell"), None)
+        return await self.ws.cancel_by_label(self.ladder_label(instrument_name))
+
+    def stats(self):
+        return {
+            "requotes": self.requotes,
+            "requests_per_requote": self.requests / self.requotes if self.requotes else 0.0,
+            "actions": dict(self.actions),
+            "mean_latency_ms": sum(self.latencies) / len(self.latencies) * 1000.0 if self.latencies else 0.0,
+        }
@@ -0,0 +1,122 @@
+import sys
+
+import numpy as np
+
+
+class LogHistogram:
+    """
+    HDR-style histogram of non-negative integer values (nanoseconds).
+
+    Values below 2**bits are counted exactly; above that every power of two
+    is split into 2**(bits-1) linear buckets, so any recorded value is
+    reported within 1 / 2**(bits-1) of its true value (about 3% with the
+    default bits=6) over the full range, using a fixed number of counters.
+    """
+
+    def __init__(self, bits=6, max_shift=40):
+        self.bits = bits
+        self.sub_count = 1 << bits
+        self.half = self.sub_count >> 1
+        self.counts = [0] * (self.sub_count + max_shift * self.half)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.bits
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def _value(self, index):
+        """Lowest value that falls into bucket `index`."""
+        if index < self.sub_count:
+            return index
+        shift, offset = divmod(index - self.sub_count, self.half)
+        return (self.half + offset) << (shift + 1)
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0  # Clock skew between the exchange and us
+        index = self._index(value)
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentiles(self, quantiles):
+        """Values at the given quantiles (0-1), as bucket lower bounds."""
+        if not self.count:
+            return [None] * len(quantiles)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.ceil(np.asarray(quantiles) * self.count).clip(1, self.count)
+        indexes = np.searchsorted(cumulative, ranks)
+        return [min(self._value(int(index)), self.max) for index in indexes]
+
+    def percentile(self, quantile):
+        return self.percentiles([quantile])[0]
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def summary(self):
+        p50, p99, p999 = self.percentiles([0.5, 0.99, 0.999])
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": p50,
+            "p99": p99,
+            "p99.9": p999,
+            "max": self.max if self.count else None,
+        }
+
+
+class LatencyTracer:
+    """
+    One LogHistogram per pipeline stage, all in nanoseconds.
+
+    Stages are created on first use. `report()` can be called at any time
+    from the event loop to read the live distributions; `dump()` prints them
+    as a table in microseconds.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}  # Stage name -> LogHistogram, in the order first seen
+
+    def record(self, stage, elapsed_ns):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LogHistogram()
+        histogram.record(elapsed_ns)
+
+    def reset(self):
+        for histogram in self.stages.values():
+            histogram.reset()
+
+    def report(self):
+        return {stage: histogram.summary() for stage, histogram in self.stages.items()}
+
+    def dump(self, stream=None):
+        stream = stream or sys.stdout
+        stream.write(f"{'stage':<18}{'count':>10}{'p50 us':>12}{'p99 us':>12}{'p99.9 us':>12}{'max us':>12}\n")
+        for stage, summary in self.report().items():
+            if not summary["count"]:
+                continue
+            stream.write(
+                f"{stage:<18}{summary['count']:>10}{summary['p50'] / 1e3:>12.1f}{summary['p99'] / 1e3:>12.1f}"
+                f"{summary['p99.9'] / 1e3:>12.1f}{summary['max'] / 1e3:>12.1f}\n"
+            )
+        stream.flush()
@@ -1,20 +1,23 @@
 import asyncio
 from dbitws import DbitWS
 import signal
-import uuid
 from calculations import calculate_stoikov
-from ringbuffer import volBuffer
+from ringbuffer import RingBuffer
 from oms import PendingOrderTracker, Order
+from quotes import QuoteManager
+from asynclog import sink as log_sink
 from config import Config, DERIBIT_URL, CLIENT_ID, CLIENT_SECRET
 from instrument_name import get_all_instruments
 
 # Initialize the volatility buffer
-volatility_buffer = volBuffer(size=16)  # Adjust size as needed
+volatility_buffer = RingBuffer(16)  # Adjust size as needed
 order_tracker = PendingOrderTracker()
 
 # Load configuration
 config = Config()
 deribit_config = config.settings.get('deribit', {})
+logging_config = config.settings.get('logging', {})
+log_sink.configure(logging_config.get('levels'), logging_config.get('sampling'))
 
 async def fetch_instrument_info():
     all_instruments = await get_all_instruments()
@@ -22,18 +25,18 @@ async def fetch_instrument_info():
     btc_future = all_instruments[(all_instruments['currency'] == 'BTC') & (all_instruments['kind'] == 'future')].iloc[0]
     return btc_future['instrument_name'], btc_future['tick_size']
 
-async def quoting_logic(dbitws, instrument_name, tick_size):
+async def quoting_logic(dbitws, quotes, instrument_name, tick_size):
     while True:
         try:
             current_volatility = dbitws.current_volatility
             
             if current_volatility is not None:
-                volatility_buffer.add(current_volatility)
+                volatility_buffer.append(current_volatility)
                 mean, upper_band, lower_band = volatility_buffer.bollinger_bands(period=16, num_std_dev=3)
                 
                 if lower_band is not None and upper_band is not None and lower_band <= current_volatility <= upper_band:
                     mid_price, spread, best_bid, best_ask, optimal_bid, optimal_ask = calculate_stoikov(
-                        dbitws.order_book,
+                        dbitws.books.get(instrument_name),
                         dbitws.inventory, 
                         current_volatility,
                         dbitws.risk_aversion,
@@ -42,16 +45,19 @@ async def quoting_logic(dbitws, instrument_name, tick_size):
                     )
                     
                     if optimal_bid is not None and optimal_ask is not None:
-                        buy_order_id = str(uuid.uuid4())
-                        sell_order_id = str(uuid.uuid4())
-                        
-                        await dbitws.place_buy(instrument_name=instrument_name, amount=10, order_type="limit", label="buy_order", price=optimal_bid)
-                        await dbitws.place_sell(instrument_name=instrument_name, amount=10, order_type="limit", label="sell_order", price=optimal_ask)
-                        
-                        order_tracker.add_order(Order(id=buy_order_id, price=optimal_bid, quantity=10, side='buy', timestamp=0, instrument_name=instrument_name))
-                        order_tracker.add_order(Order(id=sell_order_id, price=optimal_ask, quantity=10, side='sell', timestamp=0, instrument_name=instrument_name))
-                        
-                        print(f"Placed buy order at {optimal_bid} and sell order at {optimal_ask} for {instrument_name}")
+                        # Edit the resting quotes in place rather than cancelling and re-placing
+                        requests = await quotes.quote(instrument_name, optimal_bid, optimal_ask, 10, 10, tick_size=tick_size)
+
+                        for side in ('buy', 'sell'):
+                            live = quotes.get(instrument_name, side)
+                            if live is None:
+                                continue
+                            if order_tracker.get_order(live.order_id) is None:
+                                order_tracker.add_order(Order(id=live.order_id, price=live.price, quantity=live.amount, side=side, timestamp=0, instrument_name=instrument_name))
+                            else:
+                                order_tracker.update_order(live.order_id, price=live.price, quantity=live.amount)
+
+                        print(f"Quoted {optimal_bid} / {optimal_ask} for {instrument_name} ({requests} requests)")
                 else:
                     print("Volatility outside of Bollinger Bands, skipping order placement")
             else:
@@ -89,6 +95,8 @@ async def main():
     dbitws.gamma = deribit_config.get('gamma', 0.1)
     dbitws.kappa = deribit_config.get('kappa', 1.5)
     dbitws.sigma = deribit_config.get('sigma', 0.01)
+    dbitws.configure_rate_limits(deribit_config.get('rate_limits'))
+    dbitws.market_data_connections = deribit_config.get('market_data_connections', 1)
     
     await dbitws.connect()
     
@@ -119,7 +127,8 @@ async def main():
 
     # Run the trade monitor and quoting logic concurrently
     monitor_task = asyncio.create_task(trade_monitor(dbitws))
-    quoting_task = asyncio.create_task(quoting_logic(dbitws, instrument_name, tick_size))
+    quotes = QuoteManager(dbitws)
+    quoting_task = asyncio.create_task(quoting_logic(dbitws, quotes, instrument_name, tick_size))
     
     # Wait for both tasks to complete (which they won't, unless there's an error)
     await asyncio.gather(monitor_task, quoting_task)
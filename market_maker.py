@@ -1,7 +1,8 @@
 import asyncio
-from dbitmm.dbitws import DbitWS
-from dbitmm.ringbuffer import RingBuffer
-import numpy as np
+from dbitws import DbitWS
+from ringbuffer import RingBuffer
+from quotes import QuoteManager
+from calculations import spread_term
 
 
 class StoikovMarketMaker:
@@ -12,7 +13,7 @@ class StoikovMarketMaker:
 
     def calculate_optimal_prices(self, mid_price, inventory):
         reservation_price = mid_price - (self.gamma * self.sigma**2 * inventory) / self.k
-        spread = self.gamma * self.sigma**2 / self.k + (2/self.gamma) * np.log(1 + self.gamma/self.k)
+        spread = self.gamma * self.sigma**2 / self.k + spread_term(self.gamma, self.k)
         
         optimal_bid = reservation_price - spread/2
         optimal_ask = reservation_price + spread/2
@@ -24,7 +25,7 @@ class StoikovMarketMaker:
 class MarketMaker:
     def __init__(self, instrument, dbit_ws, buffer_size=100):
         self.instrument = instrument
-        self.dbit_ws = DbitWS()
+        self.dbit_ws = dbit_ws or DbitWS()
         self.stoikov = StoikovMarketMaker(gamma=0.1, k=1.5, sigma=0.2)
         self.inventory = 0
         self.mid_price = None
@@ -34,14 +35,17 @@ class MarketMaker:
         self.volatility_buffer = RingBuffer(16)  # Buffer for the last 16 volatility data points
         self.current_volatility = None
         self.volatility_range = None
+        self.quotes = QuoteManager(self.dbit_ws, label="stoikov")
+        # DbitWS's consumer hands these notifications on after its own handling
+        self.dbit_ws.add_listener('book.', self.on_orderbook, with_instrument=True)
+        self.dbit_ws.add_listener('user.trades.', self.on_trade)
 
     async def start(self):
         await self.dbit_ws.connect()
         await self.dbit_ws.subscribe_channels(
-            [f"book.{self.instrument}.100ms", f"user.trades.{self.instrument}.raw"],
-            [f"user.orders.{self.instrument}.raw"]
+            [f"book.{self.instrument}.100ms"],
+            [f"user.trades.{self.instrument}.raw", f"user.orders.{self.instrument}.raw"]
         )
-        asyncio.create_task(self.process_market_data())
         asyncio.create_task(self.update_orders())
 
 
@@ -113,19 +117,18 @@ class MarketMaker:
 
 
 
-    async def process_market_data(self):
-        while True:
-            message = await self.dbit_ws.message_queue.get()
-            if message['method'] == 'subscription':
-                channel = message['params']['channel']
-                if channel.startswith('book.'):
-                    await self.handle_orderbook(message['params']['data'])
-                elif channel.startswith('user.trades.'):
-                    await self.handle_trade(message['params']['data'])
-
-    async def handle_orderbook(self, data):
-        best_bid = data['bids'][0][0]
-        best_ask = data['asks'][0][0]
+    async def on_orderbook(self, message, instrument=None):
+        # Book events are conflated, so read the state DbitWS keeps rather than the delta
+        await self.handle_orderbook(self.dbit_ws.books.get(instrument))
+
+    async def on_trade(self, message):
+        await self.handle_trade(message['params']['data'])
+
+    async def handle_orderbook(self, book):
+        best_bid, _ = book.best_bid()
+        best_ask, _ = book.best_ask()
+        if best_bid is None or best_ask is None:
+            return
         new_mid_price = (best_bid + best_ask) / 2
         
         if self.mid_price is not None:
@@ -179,10 +182,8 @@ class MarketMaker:
                 
                 optimal_bid, optimal_ask = self.stoikov.calculate_optimal_prices(self.mid_price, self.inventory)
                 
-                # Cancel existing orders and place new ones
-                await self.dbit_ws.cancel_all_orders(self.instrument)
-                await self.dbit_ws.place_buy(self.instrument, amount=10, order_type="limit", label="stoikov_bid", price=optimal_bid)
-                await self.dbit_ws.place_sell(self.instrument, amount=10, order_type="limit", label="stoikov_ask", price=optimal_ask)
+                # Edit the resting orders in place; only sides that changed cost a request
+                await self.quotes.quote(self.instrument, optimal_bid, optimal_ask, 10, 10)
                 
                 self.last_quote_time = asyncio.get_event_loop().time()
             
@@ -1,28 +1,51 @@
 import asyncio
 import websockets
 import ujson
-from decimal import Decimal, InvalidOperation
 import zlib  # For CRC32 checksum calculation
-import polars as pl  # Import Polars
+import numpy as np
+import polars as pl  # Import Polars, only used to export book views
+from orderbook import BookSide
+from shmbook import SharedBookWriter, block_name
+from recorder import FrameRecorder
+from asynclog import INFO, get_logger
+
+log = get_logger("obfeed")
 
 class OBFeed:
     def __init__(self, pairs, depth=10):
         self.url = "wss://ws.kraken.com/v2"
         self.pairs = pairs
         self.depth = depth
-        # Initialize order book with empty DataFrames with explicit schema
+        # Sorted price-level store per symbol and side, truncated to the subscribed depth
         self.order_book = {
             pair: {
-                "bids": pl.DataFrame({"price": pl.Series(dtype=pl.Utf8), "qty": pl.Series(dtype=pl.Utf8)}),
-                "asks": pl.DataFrame({"price": pl.Series(dtype=pl.Utf8), "qty": pl.Series(dtype=pl.Utf8)}),
-                "midprice": pl.Series(dtype=pl.Utf8),  # New column for midprice
-                "weighted_midprice": pl.Series(dtype=pl.Utf8),  # New column for weighted midprice
-                "imbalance": pl.Series(dtype=pl.Utf8)  # New column for imbalance
+                "bids": BookSide(is_bid=True, capacity=depth + 64, top_levels=depth),
+                "asks": BookSide(is_bid=False, capacity=depth + 64, top_levels=depth),
             } for pair in pairs
         }
+        # Derived values per symbol, refreshed after every update
+        self.metrics = {
+            pair: {"midprice": None, "weighted_midprice": None, "imbalance": None} for pair in pairs
+        }
+        self.websocket = None
+        # Checksum state: (price_precision, qty_precision) from the instrument channel,
+        # cached per-level checksum tokens, and symbols waiting on a fresh snapshot
+        self.precision = {}
+        self.checksum_tokens = {pair: {"bids": {}, "asks": {}} for pair in pairs}
+        self.checksum_failures = {pair: 0 for pair in pairs}
+        self.resubscribing = set()
+        self.writers = {}  # Symbol -> SharedBookWriter, see share_books()
+        self.update_counts = {pair: 0 for pair in pairs}
+        self.recorder = None  # FrameRecorder, see record_frames()
 
     async def subscribe(self):
         async with websockets.connect(self.url) as websocket:
+            self.websocket = websocket
+            # Instrument snapshot carries the precisions needed to format checksum levels
+            await websocket.send(ujson.dumps({
+                "method": "subscribe",
+                "params": {"channel": "instrument", "snapshot": True}
+            }))
             subscribe_message = {
                 "method": "subscribe",
                 "params": {
@@ -38,180 +61,175 @@ class OBFeed:
     async def listen(self, websocket):
         while True:
             message = await websocket.recv()
+            if self.recorder is not None:
+                self.recorder.record(message)
             await self.process_message(message)
 
     async def process_message(self, message):
-        print(f"Received message: {message}")  # Log the raw message
+        log.debug("Received message: %s", message)  # Log the raw message
         data = ujson.loads(message)  # Only one argument
 
         if data.get("channel") == "book":
+            book_data = data["data"][0]
+            symbol = book_data["symbol"]
             if data.get("type") == "snapshot":
-                self.update_order_book(data["data"][0])
+                self.resubscribing.discard(symbol)
+                self.update_order_book(book_data, snapshot=True)
             elif data.get("type") == "update":
-                self.update_order_book(data["data"][0])
-            self.checksum(data["data"][0])
+                if symbol in self.resubscribing:
+                    return  # Stale until the resubscribe snapshot arrives
+                self.update_order_book(book_data)
+            await self.verify_checksum(book_data)
+        elif data.get("channel") == "instrument":
+            for pair in data.get("data", {}).get("pairs", []):
+                self.precision[pair["symbol"]] = (pair["price_precision"], pair["qty_precision"])
+
+    def update_order_book(self, data, snapshot=False):
+        symbol = data["symbol"]
+        book = self.order_book[symbol]
+        if snapshot:
+            book["bids"].clear()
+            book["asks"].clear()
 
-    def is_valid_decimal(self, value):
-        """Check if the value can be converted to Decimal."""
-        try:
-            Decimal(value)
-            return True
-        except (ValueError, InvalidOperation):
-            return False
+        self.apply_levels(book["bids"], data.get("bids", []))
+        self.apply_levels(book["asks"], data.get("asks", []))
 
-    def update_order_book(self, data):
-        symbol = data["symbol"]
-        bids = data.get("bids", [])
-        asks = data.get("asks", [])
-
-        # Update bids
-        for bid in bids:
-            price = bid.get("price")
-            qty = bid.get("qty")
-            if self.is_valid_decimal(price) and self.is_valid_decimal(qty):
-                # Store as strings to avoid Decimal128 limitations
-                if qty == 0:
-                    self.order_book[symbol]["bids"] = self.order_book[symbol]["bids"].filter(pl.col("price") != str(price))
-                else:
-                    new_bid = pl.DataFrame({"price": [str(price)], "qty": [str(qty)]})
-                    self.order_book[symbol]["bids"] = pl.concat([self.order_book[symbol]["bids"], new_bid])
-
-        # Update asks
-        for ask in asks:
-            price = ask.get("price")
-            qty = ask.get("qty")
-            if self.is_valid_decimal(price) and self.is_valid_decimal(qty):
-                # Store as strings to avoid Decimal128 limitations
-                if qty == 0:
-                    self.order_book[symbol]["asks"] = self.order_book[symbol]["asks"].filter(pl.col("price") != str(price))
-                else:
-                    new_ask = pl.DataFrame({"price": [str(price)], "qty": [str(qty)]})
-                    self.order_book[symbol]["asks"] = pl.concat([self.order_book[symbol]["asks"], new_ask])
+        # Truncate to the subscribed depth
+        book["bids"].truncate(self.depth)
+        book["asks"].truncate(self.depth)
+
+        self.update_counts[symbol] += 1
+        writer = self.writers.get(symbol)
+        if writer is not None:
+            writer.publish(book["bids"], book["asks"], self.update_counts[symbol])
 
         # Calculate midprice, weighted midprice, imbalance, and micro-price
         self.calculate_midprice(symbol)
         self.calculate_weighted_midprice(symbol)
         self.calculate_imbalance(symbol)
         micro_price = self.calculate_micro_price(symbol)
-        print(f"Micro-Price for {symbol}: {micro_price:.6f}" if micro_price is not None else "Micro-Price could not be calculated.")
+        if micro_price is not None:
+            log.debug("Micro-Price for %s: %.6f", symbol, micro_price)
+        else:
+            log.debug("Micro-Price could not be calculated.")
 
         # Calculate standard deviation bounds
         upper_bound, lower_bound = self.calculate_std_bounds(symbol)
         if upper_bound is not None and lower_bound is not None:
-            print(f"Upper Bound (1 Std Devs above): {upper_bound:.6f}")
-            print(f"Lower Bound (1 Std Devs below): {lower_bound:.6f}")
+            log.debug("Upper Bound (1 Std Devs above): %.6f, Lower Bound (1 Std Devs below): %.6f", upper_bound, lower_bound)
 
         # Optionally, you can call a method to process the order book further
         self.process_order_book(symbol)
 
+    def record_frames(self, directory, prefix="kraken", **kwargs):
+        """Record every received frame to `directory` (see recorder.py); returns the recorder."""
+        self.recorder = FrameRecorder(directory, prefix=prefix, **kwargs)
+        return self.recorder
+
+    def share_books(self, levels=10, prefix="kraken"):
+        """Publish the top `levels` of each symbol's book to shared memory after every update."""
+        for pair in self.pairs:
+            if pair not in self.writers:
+                self.writers[pair] = SharedBookWriter(block_name(prefix, pair), levels)
+
+    def apply_levels(self, side, levels):
+        """Apply Kraken price levels to one side in place; qty 0 removes the level."""
+        for level in levels:
+            price = float(level["price"])
+            qty = float(level["qty"])
+            if qty == 0:
+                side.delete(price)
+            else:
+                side.update(price, qty)
+
+    def book_frame(self, symbol, side):
+        """
+        Export one side of the book as a Polars DataFrame, best level first.
+        Only built on demand; the maintained book never goes through Polars.
+        """
+        prices, qtys = self.order_book[symbol][side].depth(self.depth)
+        return pl.DataFrame({"price": prices, "qty": qtys})
+
+    def _has_both_sides(self, symbol):
+        return self.order_book[symbol]["bids"].count > 0 and self.order_book[symbol]["asks"].count > 0
+
     def calculate_midprice(self, symbol):
         """
         Calculate the midprice based on the highest bid and lowest ask.
         """
-        if not self.order_book[symbol]["bids"].is_empty() and not self.order_book[symbol]["asks"].is_empty():
-            highest_bid = float(self.order_book[symbol]["bids"]["price"].to_numpy()[0])  # Highest bid price
-            lowest_ask = float(self.order_book[symbol]["asks"]["price"].to_numpy()[0])  # Lowest ask price
-            midprice = (highest_bid + lowest_ask) / 2
-            self.order_book[symbol]["midprice"] = pl.Series([str(midprice)])  # Store midprice as string
+        if self._has_both_sides(symbol):
+            highest_bid, _ = self.order_book[symbol]["bids"].best()
+            lowest_ask, _ = self.order_book[symbol]["asks"].best()
+            self.metrics[symbol]["midprice"] = (highest_bid + lowest_ask) / 2
 
     def calculate_weighted_midprice(self, symbol):
         """
         Calculate the weighted midprice based on the bids and asks.
         """
-        if not self.order_book[symbol]["bids"].is_empty() and not self.order_book[symbol]["asks"].is_empty():
-            bids = self.order_book[symbol]["bids"]
-            asks = self.order_book[symbol]["asks"]
-
-            # Calculate weighted sums
-            total_bid_qty = bids["qty"].cast(pl.Float64).sum()
-            total_ask_qty = asks["qty"].cast(pl.Float64).sum()
-
-            weighted_bid_sum = (bids["price"].cast(pl.Float64) * bids["qty"].cast(pl.Float64)).sum()
-            weighted_ask_sum = (asks["price"].cast(pl.Float64) * asks["qty"].cast(pl.Float64)).sum()
-
-            # Calculate weighted midprice
-            weighted_midprice = (weighted_bid_sum + weighted_ask_sum) / (total_bid_qty + total_ask_qty)
-            self.order_book[symbol]["weighted_midprice"] = pl.Series([str(weighted_midprice)])  # Store as string
+        if self._has_both_sides(symbol):
+            self.metrics[symbol]["weighted_midprice"] = self.calculate_micro_price(symbol)
 
     def calculate_imbalance(self, symbol):
         """
         Calculate the imbalance based on the total quantities of bids and asks.
         """
-        if not self.order_book[symbol]["bids"].is_empty() and not self.order_book[symbol]["asks"].is_empty():
-            total_bid_qty = self.order_book[symbol]["bids"]["qty"].cast(pl.Float64).sum()
-            total_ask_qty = self.order_book[symbol]["asks"]["qty"].cast(pl.Float64).sum()
+        if self._has_both_sides(symbol):
+            total_bid_qty = self.order_book[symbol]["bids"].total_amount
+            total_ask_qty = self.order_book[symbol]["asks"].total_amount
 
             # Calculate imbalance
             imbalance = (total_bid_qty - total_ask_qty) / (total_bid_qty + total_ask_qty) if (total_bid_qty + total_ask_qty) != 0 else 0
-            self.order_book[symbol]["imbalance"] = pl.Series([str(imbalance)])  # Store as string
+            self.metrics[symbol]["imbalance"] = imbalance
 
     def process_order_book(self, symbol):
         """
         Process and display the order book for the given symbol.
         """
-        print(f"Order Book for {symbol}:")
-        
-        # Display Bids
-        print("Bids:")
-        print(self.order_book[symbol]["bids"])
-
-        # Display Asks
-        print("Asks:")
-        print(self.order_book[symbol]["asks"])
-
-        # Display Midprice
-        midprice = self.order_book[symbol]["midprice"].to_numpy()[0] if not self.order_book[symbol]["midprice"].is_empty() else "N/A"
-        print(f"Midprice: {midprice}")
-
-        # Display Weighted Midprice
-        weighted_midprice = self.order_book[symbol]["weighted_midprice"].to_numpy()[0] if not self.order_book[symbol]["weighted_midprice"].is_empty() else "N/A"
-        print(f"Weighted Midprice: {weighted_midprice}")
-
-        # Display Imbalance
-        imbalance = self.order_book[symbol]["imbalance"].to_numpy()[0] if not self.order_book[symbol]["imbalance"].is_empty() else "N/A"
-        print(f"Imbalance: {imbalance}")
-
-        print("\n" + "="*40 + "\n")  # Separator for clarity
+        if not log.is_enabled(INFO):
+            return
+
+        best_bid, best_bid_qty = self.order_book[symbol]["bids"].best()
+        best_ask, best_ask_qty = self.order_book[symbol]["asks"].best()
+        metrics = self.metrics[symbol]
+        log.info(
+            "Order Book for %s: Best Bid: %s x %s, Best Ask: %s x %s, Midprice: %s, Weighted Midprice: %s, Imbalance: %s",
+            symbol, best_bid, best_bid_qty, best_ask, best_ask_qty,
+            metrics['midprice'], metrics['weighted_midprice'], metrics['imbalance']
+        )
 
     def calculate_micro_price(self, symbol):
         """
         Calculate the micro-price based on the current bids and asks.
         """
-        if not self.order_book[symbol]["bids"].is_empty() and not self.order_book[symbol]["asks"].is_empty():
+        if self._has_both_sides(symbol):
             bids = self.order_book[symbol]["bids"]
             asks = self.order_book[symbol]["asks"]
 
-            # Calculate weighted sums for bids
-            weighted_bid_sum = (bids["price"].cast(pl.Float64) * bids["qty"].cast(pl.Float64)).sum()
-            total_bid_qty = bids["qty"].cast(pl.Float64).sum()
-
-            # Calculate weighted sums for asks
-            weighted_ask_sum = (asks["price"].cast(pl.Float64) * asks["qty"].cast(pl.Float64)).sum()
-            total_ask_qty = asks["qty"].cast(pl.Float64).sum()
+            # Weighted sums over the maintained levels
+            weighted_bid_sum = np.dot(bids.prices[:bids.count], bids.amounts[:bids.count])
+            weighted_ask_sum = np.dot(asks.prices[:asks.count], asks.amounts[:asks.count])
 
             # Calculate micro-price
             total_weighted_sum = weighted_bid_sum + weighted_ask_sum
-            total_qty = total_bid_qty + total_ask_qty
+            total_qty = bids.total_amount + asks.total_amount
 
-            micro_price = total_weighted_sum / total_qty if total_qty != 0 else 0
+            micro_price = float(total_weighted_sum / total_qty) if total_qty != 0 else 0
             return micro_price
         return None  # Return None if there are no bids or asks
-    
+
     def calculate_std_deviation(self, symbol):
         """
         Calculate the standard deviation of the prices in the order book.
         """
-        if not self.order_book[symbol]["bids"].is_empty() and not self.order_book[symbol]["asks"].is_empty():
+        if self._has_both_sides(symbol):
+            bids = self.order_book[symbol]["bids"]
+            asks = self.order_book[symbol]["asks"]
+
             # Combine bids and asks prices
-            bids_prices = self.order_book[symbol]["bids"]["price"].cast(pl.Float64)
-            asks_prices = self.order_book[symbol]["asks"]["price"].cast(pl.Float64)
-            
-            # Concatenate bids and asks prices
-            all_prices = pl.concat([bids_prices, asks_prices])
-            
-            # Calculate standard deviation
-            std_dev = all_prices.std()
-            return std_dev
+            all_prices = np.concatenate((bids.prices[:bids.count], asks.prices[:asks.count]))
+
+            # Sample standard deviation, as Polars computed it
+            return float(all_prices.std(ddof=1)) if all_prices.shape[0] > 1 else None
         return None  # Return None if there are no bids or asks
 
     def calculate_std_bounds(self, symbol):
@@ -230,28 +248,79 @@ class OBFeed:
 
 
 
-    def checksum(self, data):
-        # Calculate checksum for the top 10 bids and asks
-        bids = data.get("bids", [])[:10]
-        asks = data.get("asks", [])[:10]
-
-        checksum_string = ""
-
-        # Process asks
-        for price, qty in asks:
-            price_str = str(price).replace('.', '').lstrip('0')
-            qty_str = str(qty).replace('.', '').lstrip('0')
-            checksum_string += f"{price_str}{qty_str}"
+    def _side_tokens(self, symbol, side_name, price_precision, qty_precision):
+        """
+        Checksum tokens for the top 10 levels of one side, best first.
 
-        # Process bids
-        for price, qty in bids:
-            price_str = str(price).replace('.', '').lstrip('0')
-            qty_str = str(qty).replace('.', '').lstrip('0')
-            checksum_string += f"{price_str}{qty_str}"
+        Each level's formatted token is cached by price and only rebuilt when
+        its quantity changes; if none of the top 10 levels changed the previous
+        token list is returned as is.
+        """
+        side = self.order_book[symbol][side_name]
+        start = max(side.count - 10, 0)
+        prices = side.prices[start:side.count].tolist()
+        qtys = side.amounts[start:side.count].tolist()
+        prices.reverse()  # Best first
+        qtys.reverse()
+        cache = self.checksum_tokens[symbol][side_name]
+        if cache.get("prices") == prices and cache.get("qtys") == qtys:
+            return cache["tokens"]
+
+        by_price = cache.get("by_price", {})
+        fresh = {}
+        tokens = []
+        for price, qty in zip(prices, qtys):
+            cached = by_price.get(price)
+            if cached is not None and cached[0] == qty:
+                token = cached[1]
+            else:
+                price_str = f"{price:.{price_precision}f}".replace('.', '').lstrip('0')
+                qty_str = f"{qty:.{qty_precision}f}".replace('.', '').lstrip('0')
+                token = (price_str + qty_str).encode()
+            fresh[price] = (qty, token)
+            tokens.append(token)
+        self.checksum_tokens[symbol][side_name] = {"prices": prices, "qtys": qtys, "by_price": fresh, "tokens": tokens}
+        return tokens
+
+    def compute_checksum(self, symbol):
+        """
+        Kraken v2 CRC32 over the top 10 levels of the maintained book: asks
+        from best to worst, then bids from best to worst. Returns None until
+        the symbol's precisions are known.
+        """
+        precision = self.precision.get(symbol)
+        if precision is None:
+            return None
+        price_precision, qty_precision = precision
+        asks = self._side_tokens(symbol, "asks", price_precision, qty_precision)
+        bids = self._side_tokens(symbol, "bids", price_precision, qty_precision)
+        return zlib.crc32(b"".join(asks + bids)) & 0xffffffff
+
+    async def verify_checksum(self, data):
+        symbol = data["symbol"]
+        expected = data.get("checksum")
+        if expected is None or symbol in self.resubscribing:
+            return True
+        checksum_value = self.compute_checksum(symbol)
+        if checksum_value is None or checksum_value == expected:
+            return True
 
-        # Calculate CRC32 checksum
-        checksum_value = zlib.crc32(checksum_string.encode()) & 0xffffffff
-        print(f"Checksum: {checksum_value}")
+        self.checksum_failures[symbol] += 1
+        log.warning("Checksum mismatch for %s: expected %s, got %s. Resubscribing.", symbol, expected, checksum_value)
+        await self.resubscribe(symbol)
+        return False
+
+    async def resubscribe(self, symbol):
+        """Drop and re-request the book for a single symbol to get a fresh snapshot."""
+        self.resubscribing.add(symbol)
+        await self.websocket.send(ujson.dumps({
+            "method": "unsubscribe",
+            "params": {"channel": "book", "symbol": [symbol], "depth": self.depth}
+        }))
+        await self.websocket.send(ujson.dumps({
+            "method": "subscribe",
+            "params": {"channel": "book", "symbol": [symbol], "depth": self.depth, "snapshot": True}
+        }))
 
 # Example usage
 async def main():
@@ -30,16 +30,16 @@ def fetch_ohlc_data(pair, interval=1):
 
 def calculate_volatility(df):
     """
-    Calculate the volatility based on the closing prices.
+    Calculate the close-to-close volatility (std of log returns per bar).
 
     :param df: A Polars DataFrame containing OHLC data.
     :return: The volatility as a float.
     """
-    if df is not None and not df.is_empty():
+    if df is not None and df.height > 1:
         # Convert the 'close' column to float
         close_prices = df['close'].cast(pl.Float64).to_numpy()
-        # Calculate the standard deviation of the closing prices
-        volatility = np.std(close_prices)
+        # Volatility is a property of returns, not of the price level
+        volatility = np.std(np.diff(np.log(close_prices)))
         return volatility
     return None
 
@@ -2,6 +2,10 @@ from dataclasses import dataclass
 from typing import Dict, List
 import heapq
 
+from asynclog import get_logger
+
+log = get_logger("oms")
+
 @dataclass
 class Order:
     id: str
@@ -26,10 +30,10 @@ class PendingOrderTracker:
         self.orders[order.id] = order
         if order.side == 'buy':
             heapq.heappush(self.buy_orders, (-order.price, order))
-            print(f"buy {order}")
+            log.debug("buy %s", order)
         else:
             heapq.heappush(self.sell_orders, (order.price, order))
-            print(f"sell {order}")
+            log.debug("sell %s", order)
 
     def remove_order(self, order_id: str) -> Order:
         order = self.orders.pop(order_id, None)
@@ -49,7 +53,7 @@ class PendingOrderTracker:
         if order_id in self.orders:
             for key, value in kwargs.items():
                 setattr(self.orders[order_id], key, value)
-                print("orderid", order_id)
+            log.debug("orderid %s updated: %s", order_id, kwargs)
 
     def get_best_buy_order(self) -> Order:
         while self.buy_orders:
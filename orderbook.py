@@ -0,0 +1,437 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from shmbook import SharedBookWriter, block_name
+
+
+class BookSide:
+    """
+    One side of an L2 book kept in preallocated, sorted NumPy arrays.
+
+    Levels are stored worst-to-best so the best level always sits at the end
+    of the used region: top-of-book is a single index and inserts/deletes near
+    the touch only shift a handful of elements.
+
+    The total amount on the side and the amount resting in the top
+    `top_levels` levels are maintained as each level is applied, so readers
+    never have to rescan the side.
+    """
+
+    def __init__(self, is_bid, capacity=1024, top_levels=10):
+        self.is_bid = is_bid
+        self.sign = 1.0 if is_bid else -1.0  # Sort key: price for bids, -price for asks
+        self.keys = np.empty(capacity, dtype=np.float64)
+        self.prices = np.empty(capacity, dtype=np.float64)
+        self.amounts = np.empty(capacity, dtype=np.float64)
+        self.count = 0
+        self.top_levels = top_levels
+        self.total_amount = 0.0  # Running sum over every level
+        self.top_amount = 0.0  # Running sum over the best `top_levels` levels
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        self.total_amount = 0.0
+        self.top_amount = 0.0
+
+    def resum(self):
+        """Recompute the running aggregates from scratch (drops float drift)."""
+        n = self.count
+        self.total_amount = float(self.amounts[:n].sum())
+        self.top_amount = float(self.amounts[max(n - self.top_levels, 0):n].sum())
+
+    def _grow(self):
+        capacity = self.keys.shape[0] * 2
+        for name in ("keys", "prices", "amounts"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=np.float64)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def load(self, prices, amounts):
+        """
+        Replace the side with a full set of levels in any order, sorting once
+        instead of inserting level by level. For a repeated price the last
+        level wins, as with `update`.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        keys = self.sign * prices
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        if keys.shape[0] > 1:
+            last = np.empty(keys.shape[0], dtype=bool)
+            np.not_equal(keys[1:], keys[:-1], out=last[:-1])
+            last[-1] = True
+            if not last.all():
+                order = order[last]
+                keys = keys[last]
+        n = keys.shape[0]
+        capacity = self.keys.shape[0]
+        if n > capacity:
+            while capacity < n:
+                capacity *= 2
+            self.keys = np.empty(capacity, dtype=np.float64)
+            self.prices = np.empty(capacity, dtype=np.float64)
+            self.amounts = np.empty(capacity, dtype=np.float64)
+        self.keys[:n] = keys
+        self.prices[:n] = prices[order]
+        self.amounts[:n] = amounts[order]
+        self.count = n
+        self.resum()
+
+    def _find(self, key):
+        n = self.count
+        i = int(np.searchsorted(self.keys[:n], key))
+        return i, i < n and self.keys[i] == key
+
+    def update(self, price, amount):
+        """Insert a new level or overwrite the amount of an existing one."""
+        key = self.sign * price
+        i, found = self._find(key)
+        n = self.count
+        top_start = n - self.top_levels
+        if found:
+            delta = amount - self.amounts[i]
+            self.amounts[i] = amount
+            self.total_amount += delta
+            if i >= top_start:
+                self.top_amount += delta
+            return
+        if n == self.keys.shape[0]:
+            self._grow()
+        if i < n:
+            # Overlapping slice assignment is handled safely by NumPy
+            self.keys[i + 1:n + 1] = self.keys[i:n]
+            self.prices[i + 1:n + 1] = self.prices[i:n]
+            self.amounts[i + 1:n + 1] = self.amounts[i:n]
+        self.keys[i] = key
+        self.prices[i] = price
+        self.amounts[i] = amount
+        self.count = n + 1
+        self.total_amount += amount
+        if i > top_start:
+            self.top_amount += amount
+            if top_start >= 0:
+                # The level at the old top boundary is pushed out of the top
+                self.top_amount -= self.amounts[top_start]
+
+    def delete(self, price):
+        """Remove a level; deleting an unknown price is a no-op."""
+        i, found = self._find(self.sign * price)
+        if not found:
+            return
+        n = self.count
+        amount = self.amounts[i]
+        self.total_amount -= amount
+        top_start = n - self.top_levels
+        if i >= top_start:
+            self.top_amount -= amount
+            if top_start > 0:
+                # The next level below the top moves up into it
+                self.top_amount += self.amounts[top_start - 1]
+        self.keys[i:n - 1] = self.keys[i + 1:n]
+        self.prices[i:n - 1] = self.prices[i + 1:n]
+        self.amounts[i:n - 1] = self.amounts[i + 1:n]
+        self.count = n - 1
+
+    def truncate(self, levels):
+        """Drop the worst levels so that at most `levels` remain."""
+        n = self.count
+        k = n - levels
+        if k <= 0:
+            return
+        self.total_amount -= float(self.amounts[:k].sum())
+        top_start = n - self.top_levels
+        if k > top_start:
+            self.top_amount -= float(self.amounts[max(top_start, 0):k].sum())
+        self.keys[:levels] = self.keys[k:n]
+        self.prices[:levels] = self.prices[k:n]
+        self.amounts[:levels] = self.amounts[k:n]
+        self.count = levels
+
+    def best(self):
+        """Return (price, amount) of the best level, or (None, None) if empty."""
+        if self.count == 0:
+            return None, None
+        i = self.count - 1
+        return float(self.prices[i]), float(self.amounts[i])
+
+    def depth(self, levels):
+        """
+        Return (prices, amounts) for the top `levels` levels, best first.
+
+        Both arrays are views into the book (no copy) and are only valid until
+        the next update.
+        """
+        n = self.count
+        start = max(n - levels, 0)
+        return self.prices[start:n][::-1], self.amounts[start:n][::-1]
+
+    def cumulative_depth(self):
+        """Cumulative amount over the top `top_levels` levels, best first."""
+        return np.cumsum(self.depth(self.top_levels)[1])
+
+    def items(self):
+        """Iterate (price, amount) pairs from best to worst."""
+        for i in range(self.count - 1, -1, -1):
+            yield float(self.prices[i]), float(self.amounts[i])
+
+
+class OrderBook:
+    """
+    Two-sided L2 book for a single instrument with Deribit snapshot/change
+    semantics.
+
+    When a change does not follow on from the last applied change_id the book
+    enters resync: further changes are buffered until a fresh snapshot
+    arrives, after which the buffered changes newer than the snapshot are
+    replayed. At most MAX_PENDING changes are buffered; past that the buffer
+    is dropped and a new snapshot requested.
+    """
+
+    MAX_PENDING = 10000  # Changes buffered while resyncing before the resync starts over
+
+    def __init__(self, instrument_name=None, capacity=1024, top_levels=10):
+        self.instrument_name = instrument_name
+        self.bids = BookSide(is_bid=True, capacity=capacity, top_levels=top_levels)
+        self.asks = BookSide(is_bid=False, capacity=capacity, top_levels=top_levels)
+        self.change_id = None
+        self.timestamp = None
+        self.quote = None  # Last (mid, spread, best_bid, best_ask, optimal_bid, optimal_ask) for this book
+        self.received_ns = 0  # perf_counter_ns() when the frame behind `quote` was received
+
+        # Resync state
+        self.resyncing = False
+        self.snapshot_requested = False
+        self.pending = deque()  # Changes received while resyncing
+        self.gap_count = 0
+        self.pending_overflows = 0
+        self.resync_started = None
+        self.last_recovery_ms = None
+        self.recovery_ms = deque(maxlen=100)  # Recent gap-to-recovered times
+
+    def __len__(self):
+        return self.bids.count + self.asks.count
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.change_id = None
+
+    @property
+    def needs_snapshot(self):
+        """True once a gap was detected and no snapshot request is in flight."""
+        return self.resyncing and not self.snapshot_requested
+
+    def reset(self):
+        """
+        Drop the book while a resubscription is in flight: changes are
+        buffered and the subscription's initial snapshot completes the resync.
+        """
+        self.clear()
+        self.pending.clear()
+        self.resyncing = True
+        self.snapshot_requested = True
+        self.resync_started = time.perf_counter()
+
+    def begin_resync(self):
+        self.gap_count += 1
+        self.resyncing = True
+        self.snapshot_requested = False
+        self.resync_started = time.perf_counter()
+
+    def apply_snapshot(self, bids, asks, change_id, timestamp=None):
+        """
+        Replace the book with a full snapshot.
+
+        Levels may be given as Deribit notification triples
+        (["new", price, amount]) or as get_order_book pairs ([price, amount]).
+        If the book was resyncing, buffered changes newer than the snapshot are
+        replayed on top of it.
+        """
+        self.bids.load([level[-2] for level in bids], [level[-1] for level in bids])
+        self.asks.load([level[-2] for level in asks], [level[-1] for level in asks])
+        self.change_id = change_id
+        self.timestamp = timestamp
+
+        if self.resyncing:
+            self._replay_pending()
+
+    def _replay_pending(self):
+        pending = self.pending
+        self.pending = deque()
+        self.resyncing = False
+        self.snapshot_requested = False
+        while pending:
+            bids, asks, change_id, prev_change_id, timestamp = pending.popleft()
+            if change_id <= self.change_id:
+                continue  # Already contained in the snapshot
+            if prev_change_id != self.change_id:
+                # The snapshot is older than the buffered stream; go again
+                # without counting a new gap or restarting the recovery clock
+                self.resyncing = True
+                self.pending = pending
+                self.pending.appendleft((bids, asks, change_id, prev_change_id, timestamp))
+                return
+            self._apply_levels(bids, asks, change_id, timestamp)
+
+        self.last_recovery_ms = (time.perf_counter() - self.resync_started) * 1000.0
+        self.recovery_ms.append(self.last_recovery_ms)
+
+    def apply_change(self, bids, asks, change_id, prev_change_id, timestamp=None):
+        """
+        Apply an incremental update.
+
+        Returns False without touching the book if the book is resyncing or
+        prev_change_id does not follow on from the last applied change; in
+        both cases the change is buffered for replay after the next snapshot.
+        A change already contained in the book (change_id <= the book's, e.g.
+        in flight while a get_order_book snapshot was taken) is dropped.
+        """
+        if not self.resyncing and self.change_id is not None and change_id <= self.change_id:
+            return False
+        if self.resyncing or prev_change_id != self.change_id:
+            if not self.resyncing:
+                self.begin_resync()
+            elif len(self.pending) >= self.MAX_PENDING:
+                # The snapshot is failing or too slow to catch up with the stream:
+                # start buffering afresh and ask for a new one
+                self.pending.clear()
+                self.pending_overflows += 1
+                self.snapshot_requested = False
+            self.pending.append((bids, asks, change_id, prev_change_id, timestamp))
+            return False
+
+        self._apply_levels(bids, asks, change_id, timestamp)
+        return True
+
+    def _apply_levels(self, bids, asks, change_id, timestamp):
+        for action, price, amount in bids:
+            if action == "delete":
+                self.bids.delete(price)
+            else:  # "new" or "change"
+                self.bids.update(price, amount)
+
+        for action, price, amount in asks:
+            if action == "delete":
+                self.asks.delete(price)
+            else:  # "new" or "change"
+                self.asks.update(price, amount)
+
+        self.change_id = change_id
+        self.timestamp = timestamp
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def depth(self, levels):
+        """Return ((bid_prices, bid_amounts), (ask_prices, ask_amounts)) views."""
+        return self.bids.depth(levels), self.asks.depth(levels)
+
+    @property
+    def bid_volume(self):
+        return self.bids.total_amount
+
+    @property
+    def ask_volume(self):
+        return self.asks.total_amount
+
+    @property
+    def imbalance(self):
+        """(bid volume - ask volume) / (bid volume + ask volume) over the whole book."""
+        total = self.bids.total_amount + self.asks.total_amount
+        return (self.bids.total_amount - self.asks.total_amount) / total if total > 0 else 0
+
+    @property
+    def top_imbalance(self):
+        """Same as `imbalance` but restricted to the top `top_levels` levels."""
+        total = self.bids.top_amount + self.asks.top_amount
+        return (self.bids.top_amount - self.asks.top_amount) / total if total > 0 else 0
+
+
+class BookManager:
+    """
+    One OrderBook per instrument, with routing from book.{instrument}.*
+    channels to the right book. The channel -> book mapping is cached so
+    dispatch stays a single dict lookup however many instruments are live.
+    """
+
+    def __init__(self, capacity=1024, top_levels=10):
+        self.capacity = capacity
+        self.top_levels = top_levels
+        self.books = {}  # instrument name -> OrderBook
+        self.channels = {}  # channel -> OrderBook
+        self.shared_levels = None  # Set by share() to publish books to shared memory
+        self.shared_prefix = None
+        self.writers = {}  # instrument name -> SharedBookWriter
+        self.listeners = {}  # instrument name (None = every book) -> [callback(book)]
+
+    def __len__(self):
+        return len(self.books)
+
+    def __contains__(self, instrument_name):
+        return instrument_name in self.books
+
+    def __getitem__(self, instrument_name):
+        return self.books[instrument_name]
+
+    def __iter__(self):
+        return iter(self.books.values())
+
+    def get(self, instrument_name):
+        """Return the book for an instrument, creating it on first use."""
+        book = self.books.get(instrument_name)
+        if book is None:
+            book = OrderBook(instrument_name, capacity=self.capacity, top_levels=self.top_levels)
+            self.books[instrument_name] = book
+        return book
+
+    def route(self, channel):
+        """Return the book for a book.{instrument}.* channel."""
+        book = self.channels.get(channel)
+        if book is None:
+            book = self.get(channel.split('.')[1])
+            self.channels[channel] = book
+        return book
+
+    def share(self, levels=20, prefix="dbit"):
+        """Publish the top `levels` of every book to shared memory after each update."""
+        self.shared_levels = levels
+        self.shared_prefix = prefix
+
+    def add_listener(self, callback, instrument_name=None):
+        """Call `callback(book)` after every update of one instrument's book (or of every book)."""
+        self.listeners.setdefault(instrument_name, []).append(callback)
+
+    def remove_listener(self, callback, instrument_name=None):
+        callbacks = self.listeners.get(instrument_name)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, book):
+        if self.listeners:
+            for callback in self.listeners.get(book.instrument_name, ()):
+                callback(book)
+            for callback in self.listeners.get(None, ()):
+                callback(book)
+        if self.shared_levels is None:
+            return
+        writer = self.writers.get(book.instrument_name)
+        if writer is None:
+            writer = SharedBookWriter(block_name(self.shared_prefix, book.instrument_name), self.shared_levels)
+            self.writers[book.instrument_name] = writer
+        writer.publish(book.bids, book.asks, book.change_id, book.timestamp)
+
+    def close(self):
+        """Release and unlink the shared memory blocks; readers keep their own mappings."""
+        for writer in self.writers.values():
+            writer.close(unlink=True)
+        self.writers.clear()
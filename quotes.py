@@ -0,0 +1,146 @@
+import asyncio
+import math
+import time
+from collections import Counter, deque
+
+from asynclog import get_logger
+
+CLOSED_STATES = ("filled", "cancelled", "rejected")
+NOT_OPEN_ORDER = 11044  # Deribit error code for editing/cancelling an order that is no longer open
+
+log = get_logger("quotes")
+
+
+class LiveQuote:
+    __slots__ = ("order_id", "price", "amount", "label")
+
+    def __init__(self, order_id, price, amount, label):
+        self.order_id = order_id
+        self.price = price
+        self.amount = amount
+        self.label = label
+
+    def __repr__(self):
+        return f"LiveQuote({self.order_id}, {self.price}, {self.amount}, {self.label})"
+
+
+class QuoteManager:
+    """
+    Keeps one resting bid and ask per instrument and moves them towards a
+    target quote with the fewest requests.
+
+    For each side the target is compared with the live order: unchanged is a
+    no-op, a new price or amount is a `private/edit` (keeping the order id),
+    no live order is a place and no target is a cancel. Both sides are sent
+    concurrently, so a requote costs 0-2 requests and one round trip of wall
+    time instead of cancel-all followed by two sequential places.
+    """
+
+    def __init__(self, ws, label="mm", post_only=True):
+        self.ws = ws
+        self.label = label
+        self.post_only = post_only
+        self.live = {}  # (instrument, side) -> LiveQuote
+
+        # Requote metrics
+        self.requotes = 0
+        self.requests = Counter()  # Requests per requote -> count
+        self.actions = Counter()  # "noop" / "edit" / "place" / "cancel" / "replace"
+        self.latencies = deque(maxlen=1000)  # Seconds per requote
+
+    def get(self, instrument_name, side):
+        quote = self.live.get((instrument_name, side))
+        if quote is None:
+            return None
+        # Drop orders the user.orders channel has reported as done
+        state = self.ws.order_states[instrument_name].get(quote.order_id)
+        if state is not None and state.get('order_state') in CLOSED_STATES:
+            del self.live[(instrument_name, side)]
+            return None
+        return quote
+
+    async def quote(self, instrument_name, bid_price, ask_price, bid_amount, ask_amount, tick_size=None):
+        """
+        Move the live quotes for an instrument to the target prices. A side
+        with a None price or non-positive amount is cancelled. Prices are
+        rounded away from the mid to `tick_size` (default: the instrument's
+        tick size, if known). Returns the number of requests sent.
+        """
+        if tick_size is None:
+            tick_size = self.ws.instrument_details.get(instrument_name, {}).get('tick_size')
+        if tick_size:
+            if bid_price is not None:
+                bid_price = math.floor(bid_price / tick_size) * tick_size
+            if ask_price is not None:
+                ask_price = math.ceil(ask_price / tick_size) * tick_size
+
+        start = time.perf_counter()
+        sent = await asyncio.gather(
+            self.reconcile(instrument_name, "buy", bid_price, bid_amount),
+            self.reconcile(instrument_name, "sell", ask_price, ask_amount)
+        )
+        requests = sent[0] + sent[1]
+        self.requotes += 1
+        self.requests[requests] += 1
+        self.latencies.append(time.perf_counter() - start)
+        return requests
+
+    async def reconcile(self, instrument_name, side, price, amount):
+        """Apply the cheapest action for one side; returns the number of requests sent."""
+        key = (instrument_name, side)
+        live = self.get(instrument_name, side)
+
+        if price is None or not amount or amount <= 0:
+            if live is None:
+                self.actions["noop"] += 1
+                return 0
+            self.actions["cancel"] += 1
+            del self.live[key]
+            await self.ws.cancel_order(live.order_id)
+            return 1
+
+        if live is not None:
+            if live.price == price and live.amount == amount:
+                self.actions["noop"] += 1
+                return 0
+            self.actions["edit"] += 1
+            response = await self.ws.edit_order(live.order_id, amount, price, post_only=self.post_only)
+            if 'result' in response:
+                live.price = price
+                live.amount = amount
+                return 1
+            if response.get('error', {}).get('code') != NOT_OPEN_ORDER:
+                log.warning("Edit failed for %s %s: %s", instrument_name, side, response)
+                return 1
+            # Filled or cancelled before the edit arrived: place a fresh order instead
+            self.actions["replace"] += 1
+            del self.live[key]
+            return 1 + await self.place(instrument_name, side, price, amount)
+
+        self.actions["place"] += 1
+        return await self.place(instrument_name, side, price, amount)
+
+    async def place(self, instrument_name, side, price, amount):
+        label = f"{self.label}_{side}"
+        method = self.ws.place_buy if side == "buy" else self.ws.place_sell
+        order_id = await method(instrument_name, amount, "limit", label, price=price, post_only=self.post_only)
+        if order_id is not None:
+            self.live[(instrument_name, side)] = LiveQuote(order_id, price, amount, label)
+        return 1
+
+    async def cancel_all(self, instrument_name):
+        """Cancel both live quotes for an instrument concurrently."""
+        await asyncio.gather(
+            self.reconcile(instrument_name, "buy", None, 0),
+            self.reconcile(instrument_name, "sell", None, 0)
+        )
+
+    def stats(self):
+        total = sum(count * requests for requests, count in self.requests.items())
+        return {
+            "requotes": self.requotes,
+            "requests_per_requote": total / self.requotes if self.requotes else 0.0,
+            "requests_histogram": dict(self.requests),
+            "actions": dict(self.actions),
+            "mean_latency_ms": sum(self.latencies) / len(self.latencies) * 1000.0 if self.latencies else 0.0,
+        }
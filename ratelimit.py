@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+
+# Scheduling priorities, lowest first: pulling quotes must never wait behind new ones
+CANCEL = 0
+EDIT = 1
+NEW = 2
+
+# Requests that count against the matching engine credit pool
+MATCHING_ENGINE_METHODS = {
+    "private/buy",
+    "private/sell",
+    "private/edit",
+    "private/edit_by_label",
+    "private/cancel",
+    "private/cancel_all",
+    "private/cancel_all_by_instrument",
+    "private/cancel_all_by_currency",
+    "private/cancel_by_label",
+    "private/close_position",
+}
+
+
+def method_priority(method):
+    if method.startswith("private/cancel"):
+        return CANCEL
+    if method.startswith("private/edit"):
+        return EDIT
+    return NEW
+
+
+class PendingRequest:
+    __slots__ = ("priority", "key", "send", "futures", "enqueued_at")
+
+    def __init__(self, priority, key, send, future):
+        self.priority = priority
+        self.key = key
+        self.send = send
+        self.futures = [future]
+        self.enqueued_at = time.perf_counter()
+
+
+class CreditLimiter:
+    """
+    Token bucket modelled on Deribit's request credits.
+
+    Every request costs `cost` credits; the bucket holds at most
+    `max_credits` and refills at `refill_rate` credits per second. Requests
+    that can't be sent yet wait in per-priority queues, cancels first, then
+    edits, then new orders. A request submitted with the same `key` (order id)
+    as one still waiting replaces it: the newer request is sent once, with the
+    more urgent of the two priorities, and both callers get its response. A
+    queued cancel is never replaced by anything but another cancel; an edit
+    submitted behind it is queued on its own and goes out after the cancel.
+    """
+
+    def __init__(self, max_credits, refill_rate, cost=1, name="limiter"):
+        self.name = name
+        self.max_credits = max_credits
+        self.refill_rate = refill_rate
+        self.cost = cost
+        self.credits = max_credits
+        self.refilled_at = time.perf_counter()
+        self.queues = (deque(), deque(), deque())  # One per priority
+        self.queued = {}  # Key -> PendingRequest still waiting
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+        self.sent = 0
+        self.coalesced = 0
+        self.waits = deque(maxlen=1000)  # Seconds spent queued, per sent request
+        self.max_wait = 0.0
+
+    def configure(self, max_credits=None, refill_rate=None, cost=None):
+        if max_credits is not None:
+            self.max_credits = max_credits
+            self.credits = min(self.credits, max_credits)
+        if refill_rate is not None:
+            self.refill_rate = refill_rate
+        if cost is not None:
+            self.cost = cost
+
+    def refill(self):
+        now = time.perf_counter()
+        self.credits = min(self.max_credits, self.credits + (now - self.refilled_at) * self.refill_rate)
+        self.refilled_at = now
+
+    def submit(self, send, priority=NEW, key=None):
+        """
+        Queue `send` (a coroutine function returning the response) and return
+        a future for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        pending = self.queued.get(key) if key is not None else None
+        if pending is not None and (pending.priority != CANCEL or priority == CANCEL):
+            # Superseded before it was sent: keep one request, the newest
+            self.coalesced += 1
+            pending.send = send
+            pending.futures.append(future)
+            if priority < pending.priority:
+                self.queues[pending.priority].remove(pending)
+                pending.priority = priority
+                self.queues[priority].append(pending)
+            return future
+
+        pending = PendingRequest(priority, key, send, future)
+        self.queues[priority].append(pending)
+        if key is not None:
+            self.queued[key] = pending
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        self.wakeup.set()
+        return future
+
+    def next_request(self):
+        for queue in self.queues:
+            if queue:
+                return queue.popleft()
+        return None
+
+    async def run(self):
+        while True:
+            if not any(self.queues):
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            self.refill()
+            if self.credits < self.cost:
+                await asyncio.sleep((self.cost - self.credits) / self.refill_rate)
+                continue
+
+            pending = self.next_request()
+            if pending.key is not None and self.queued.get(pending.key) is pending:
+                del self.queued[pending.key]
+            futures = [future for future in pending.futures if not future.done()]
+            if not futures:
+                continue  # Every caller gave up (timed out) while it was queued
+
+            self.credits -= self.cost
+            self.sent += 1
+            wait = time.perf_counter() - pending.enqueued_at
+            self.waits.append(wait)
+            if wait > self.max_wait:
+                self.max_wait = wait
+            task = asyncio.ensure_future(pending.send())
+            task.add_done_callback(lambda task, futures=futures: self.complete(task, futures))
+
+    @staticmethod
+    def complete(task, futures):
+        for future in futures:
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+    def stats(self):
+        self.refill()
+        return {
+            "credits": self.credits,
+            "queued": [len(queue) for queue in self.queues],
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "mean_wait_ms": sum(self.waits) / len(self.waits) * 1000.0 if self.waits else 0.0,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
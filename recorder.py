@@ -0,0 +1,255 @@
+"""
+Raw websocket frame recording and replay.
+
+A recording is a set of append-only files. Each file starts with a header
+(magic, wall clock and monotonic clock at open) followed by independently
+compressed chunks:
+
+    chunk  = codec (1 byte) | raw length (u32) | compressed length (u32) | payload
+    payload = record*
+    record = receive time, perf_counter_ns (i64) | frame length (u32) | frame bytes
+
+Chunks are compressed with zstd when the `zstandard` package is installed
+and with zlib otherwise; the codec is stored per chunk, so either reader can
+read both. A crash loses at most the chunk being filled, and a truncated
+last chunk is ignored when reading.
+"""
+import asyncio
+import glob
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from asynclog import get_logger
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib is used instead
+    zstandard = None
+
+MAGIC = b"FRAMES1\n"
+FILE_HEADER = struct.Struct("<8sqq")  # Magic, time.time_ns(), perf_counter_ns() at open
+CHUNK_HEADER = struct.Struct("<BII")
+RECORD_HEADER = struct.Struct("<qI")
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+log = get_logger("recorder")
+
+
+class FrameRecorder:
+    """
+    Records raw frames with their receive timestamps.
+
+    `record` only appends to an in-memory buffer; full chunks are compressed
+    and written by a single background thread, so the receive loop never
+    waits on compression or disk. A new file is started once the current
+    one reaches `max_file_bytes` or is older than `max_file_seconds`.
+    """
+
+    def __init__(self, directory, prefix="frames", chunk_bytes=1 << 20, max_file_bytes=256 << 20,
+                 max_file_seconds=3600, level=3):
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_bytes = chunk_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+        if zstandard is not None:
+            self.codec = CODEC_ZSTD
+            self.compressor = zstandard.ZstdCompressor(level=level)
+        else:
+            self.codec = CODEC_ZLIB
+            self.compressor = None
+        self.level = level
+
+        os.makedirs(directory, exist_ok=True)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-recorder")
+        self.buffer = bytearray()
+        self.file = None
+        self.file_bytes = 0
+        self.file_opened = 0.0
+        self.file_seq = 0
+        self.frames = 0
+        self.raw_bytes = 0
+        self.written_bytes = 0
+        self.files = []
+
+    def record(self, frame, received_ns=None):
+        if isinstance(frame, str):
+            frame = frame.encode()
+        if received_ns is None:
+            received_ns = time.perf_counter_ns()
+        self.buffer += RECORD_HEADER.pack(received_ns, len(frame))
+        self.buffer += frame
+        self.frames += 1
+        if len(self.buffer) >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        """Hand the current chunk to the writer thread."""
+        if not self.buffer:
+            return
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        self.raw_bytes += len(chunk)
+        self.writer.submit(self._write_chunk, chunk)
+
+    def _compress(self, chunk):
+        if self.codec == CODEC_ZSTD:
+            return self.compressor.compress(chunk)
+        return zlib.compress(chunk, self.level)
+
+    def _open_file(self):
+        self.file_seq += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self.file_seq:04d}.frames")
+        self.file = open(path, "ab")
+        self.file.write(FILE_HEADER.pack(MAGIC, time.time_ns(), time.perf_counter_ns()))
+        self.file_bytes = FILE_HEADER.size
+        self.file_opened = time.monotonic()
+        self.files.append(path)
+
+    def _write_chunk(self, chunk):
+        # Runs on the writer thread; rotation happens on chunk boundaries
+        if self.file is not None and (self.file_bytes >= self.max_file_bytes
+                                      or time.monotonic() - self.file_opened >= self.max_file_seconds):
+            self.file.close()
+            self.file = None
+        if self.file is None:
+            self._open_file()
+        payload = self._compress(chunk)
+        self.file.write(CHUNK_HEADER.pack(self.codec, len(chunk), len(payload)))
+        self.file.write(payload)
+        self.file.flush()
+        self.file_bytes += CHUNK_HEADER.size + len(payload)
+        self.written_bytes += CHUNK_HEADER.size + len(payload)
+
+    def close(self):
+        self.flush()
+        self.writer.shutdown(wait=True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "raw_bytes": self.raw_bytes,
+            "written_bytes": self.written_bytes,
+            "ratio": self.raw_bytes / self.written_bytes if self.written_bytes else None,
+            "files": len(self.files),
+        }
+
+
+def _decompress(codec, payload, raw_length):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Recording is zstd compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=raw_length)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    return payload
+
+
+def read_frames(paths):
+    """Yield (received_ns, frame) from recording files in order; a glob pattern is expanded."""
+    if isinstance(paths, str):
+        paths = sorted(glob.glob(paths)) or [paths]
+    for path in paths:
+        with open(path, "rb") as file:
+            header = file.read(FILE_HEADER.size)
+            if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header)[0] != MAGIC:
+                raise ValueError(f"{path} is not a frame recording")
+            while True:
+                chunk_header = file.read(CHUNK_HEADER.size)
+                if len(chunk_header) < CHUNK_HEADER.size:
+                    break
+                codec, raw_length, length = CHUNK_HEADER.unpack(chunk_header)
+                payload = file.read(length)
+                if len(payload) < length:
+                    break  # Truncated by a crash mid-write
+                chunk = _decompress(codec, payload, raw_length)
+                view = memoryview(chunk)
+                offset = 0
+                while offset < len(chunk):
+                    received_ns, size = RECORD_HEADER.unpack_from(chunk, offset)
+                    offset += RECORD_HEADER.size
+                    yield received_ns, bytes(view[offset:offset + size])
+                    offset += size
+
+
+async def replay(paths, handle, speed=None):
+    """
+    Feed recorded frames to `handle(frame, received_ns)` (a coroutine function).
+
+    With `speed=None` frames are replayed as fast as the handler allows;
+    otherwise at the recorded pace scaled by `speed` (1.0 = real time).
+    Returns (frames, seconds).
+    """
+    start = time.perf_counter()
+    first_ns = None
+    count = 0
+    for received_ns, frame in read_frames(paths):
+        if speed is not None:
+            if first_ns is None:
+                first_ns = received_ns
+            delay = (received_ns - first_ns) / 1e9 / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await handle(frame, time.perf_counter_ns())
+        count += 1
+    return count, time.perf_counter() - start
+
+
+async def replay_dbitws(ws, paths, speed=None):
+    """
+    Replay a DbitWS recording without a network: every frame goes through
+    `handle_frame` and then every queued notification through
+    `process_message`, one frame at a time, so a run is deterministic.
+    Books that hit a sequence gap are rebuilt from the recorded
+    get_order_book response, as they were live.
+    """
+    async def handle(frame, received_ns):
+        await ws.handle_frame(frame, received_ns)
+        queue = ws.message_queue
+        while not queue.empty():
+            try:
+                await ws.process_message(queue.get_nowait())
+            except Exception as e:  # Same handling as DbitWS.process_messages
+                log.error("Error processing message: %r", e)
+
+    return await replay(paths, handle, speed)
+
+
+async def replay_obfeed(feed, paths, speed=None):
+    """Replay an OBFeed recording through `OBFeed.process_message`."""
+    async def handle(frame, received_ns):
+        await feed.process_message(frame)
+
+    return await replay(paths, handle, speed)
+
+
+async def _main(paths, speed, sigma=None):
+    from dbitws import DbitWS
+
+    ws = DbitWS()
+    ws.risk_aversion = 0.1
+    ws.time_horizon = 1
+    ws.current_volatility = sigma  # Fallback until the recording's DVOL or realized bars provide one
+    count, seconds = await replay_dbitws(ws, paths, speed)
+    print(f"Replayed {count} frames in {seconds:.3f}s ({count / seconds if seconds else 0:.0f} frames/s)")
+    ws.latency.dump()
+
+
+if __name__ == "__main__":
+    # python recorder.py "<recording glob>" [speed|max] [sigma]
+    speed = sys.argv[2] if len(sys.argv) > 2 else "max"
+    asyncio.run(_main(
+        sys.argv[1],
+        None if speed == "max" else float(speed),
+        float(sys.argv[3]) if len(sys.argv) > 3 else None
+    ))
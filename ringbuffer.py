@@ -1,32 +1,210 @@
+from collections import deque
+
 import numpy as np  # Import NumPy for numerical calculations
 
-class volBuffer:
-    def __init__(self, size):
+from asynclog import get_logger
+
+log = get_logger("ringbuffer")
+
+
+class RollingWindow:
+    """
+    Running statistics over the last `length` values of a RingBuffer.
+
+    Mean and variance use Welford's update, extended to slide: when the
+    window is full the evicted value is removed in the same O(1) step.
+    Min and max come from monotonic deques of (sequence, value), so they are
+    O(1) amortized as well.
+    """
+
+    __slots__ = ("length", "count", "mean", "m2", "mins", "maxs")
+
+    def __init__(self, length):
+        self.length = length
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+        self.mins = deque()  # Increasing values; the front is the window minimum
+        self.maxs = deque()  # Decreasing values; the front is the window maximum
+
+    def push(self, value, evicted, seq):
+        if evicted is None:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        else:
+            mean = self.mean + (value - evicted) / self.length
+            self.m2 += (value - evicted) * (value - mean + evicted - self.mean)
+            if self.m2 < 0.0:
+                self.m2 = 0.0  # Rounding when the window is (nearly) constant
+            self.mean = mean
+
+        oldest = seq - self.length
+        mins = self.mins
+        while mins and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((seq, value))
+        if mins[0][0] <= oldest:
+            mins.popleft()
+        maxs = self.maxs
+        while maxs and maxs[-1][1] <= value:
+            maxs.pop()
+        maxs.append((seq, value))
+        if maxs[0][0] <= oldest:
+            maxs.popleft()
+
+    def seed(self, values, first_seq):
+        """Recompute everything from the window's values (oldest first)."""
+        self.count = len(values)
+        self.mean = float(values.mean()) if self.count else 0.0
+        self.m2 = float(((values - self.mean) ** 2).sum()) if self.count else 0.0
+        self.mins.clear()
+        self.maxs.clear()
+        for offset, value in enumerate(values.tolist()):
+            seq = first_seq + offset
+            while self.mins and self.mins[-1][1] >= value:
+                self.mins.pop()
+            self.mins.append((seq, value))
+            while self.maxs and self.maxs[-1][1] <= value:
+                self.maxs.pop()
+            self.maxs.append((seq, value))
+
+    def variance(self, ddof=0):
+        if self.count <= ddof:
+            return 0.0
+        return self.m2 / (self.count - ddof)
+
+
+class RingBuffer:
+    """
+    Fixed-size float ring buffer with O(1) rolling statistics.
+
+    Values are stored twice in a NumPy array of 2 * size (at i and i + size),
+    so the last n values are always one contiguous slice: `view()` returns
+    them oldest first without copying. Statistics are kept incrementally for
+    the full buffer and for any shorter `windows`, and optionally as an
+    exponentially weighted mean/variance with smoothing factor `alpha`.
+    Until the buffer is full, statistics cover only the values appended so
+    far.
+    """
+
+    RESYNC_EVERY = 64  # Recompute sums from the data every RESYNC_EVERY * size appends to bound rounding drift
+
+    def __init__(self, size, windows=(), alpha=None):
         self.size = size
-        self.buffer = [0.0] * size  # Initialize the buffer with zeros
-        self.index = 0  # Current index for the next write
-        self.count = 0  # Count of elements added
+        self.data = np.zeros(2 * size)
+        self.seq = 0  # Number of values appended so far
+        self.windows = {size: RollingWindow(size)}
+        for length in windows:
+            self.add_window(length)
+        self.alpha = alpha
+        self.ewma = None
+        self.ewm_var = 0.0
+
+    def __len__(self):
+        return min(self.seq, self.size)
+
+    @property
+    def is_full(self):
+        return self.seq >= self.size
+
+    @property
+    def last(self):
+        return float(self.data[(self.seq - 1) % self.size]) if self.seq else None
+
+    def add_window(self, length):
+        """Track statistics over the last `length` values as well (length <= size)."""
+        if not 0 < length <= self.size:
+            raise ValueError(f"Window length must be between 1 and {self.size}")
+        window = self.windows.get(length)
+        if window is None:
+            window = self.windows[length] = RollingWindow(length)
+            values = self.view(length)
+            window.seed(values, self.seq - len(values))
+        return window
+
+    def append(self, value):
+        value = float(value)
+        seq = self.seq
+        size = self.size
+        data = self.data
+        for length, window in self.windows.items():
+            # Read evicted values before the slot is overwritten (the full window's is the same slot)
+            window.push(value, float(data[(seq - length) % size]) if seq >= length else None, seq)
+        position = seq % size
+        data[position] = value
+        data[position + size] = value
+        self.seq = seq + 1
+
+        if self.alpha is not None:
+            if self.ewma is None:
+                self.ewma = value
+            else:
+                delta = value - self.ewma
+                self.ewma += self.alpha * delta
+                self.ewm_var = (1 - self.alpha) * (self.ewm_var + self.alpha * delta * delta)
+
+        if self.seq % (self.RESYNC_EVERY * size) == 0:
+            for length, window in self.windows.items():
+                window.seed(self.view(length), self.seq - length)
+
+    def view(self, n=None):
+        """The last n values (default: all stored), oldest first, as a read-only view of the buffer."""
+        count = len(self)
+        n = count if n is None else min(n, count)
+        end = (self.seq - 1) % self.size + 1 + self.size if self.seq else 0
+        values = self.data[end - n:end]
+        values.flags.writeable = False  # Only affects this view
+        return values
+
+    def window(self, length=None):
+        return self.windows[length or self.size]
+
+    def get_mean(self, window=None):
+        return self.windows[window or self.size].mean
+
+    def get_var(self, window=None, ddof=0):
+        return self.windows[window or self.size].variance(ddof)
+
+    def get_std(self, window=None, ddof=0):
+        return self.windows[window or self.size].variance(ddof) ** 0.5
+
+    def get_min(self, window=None):
+        mins = self.windows[window or self.size].mins
+        return mins[0][1] if mins else None
+
+    def get_max(self, window=None):
+        maxs = self.windows[window or self.size].maxs
+        return maxs[0][1] if maxs else None
+
+    def get_ewm_std(self):
+        return self.ewm_var ** 0.5
+
+    def bollinger_bands(self, period=20, num_std_dev=3):
+        """(mean, upper, lower) over the last `period` values, or Nones until that many have arrived."""
+        if self.seq < period:
+            return None, None, None  # Not enough data to calculate Bollinger Bands
+        window = self.windows.get(period) or self.add_window(period)
+        std_dev = window.variance() ** 0.5
+        return window.mean, window.mean + num_std_dev * std_dev, window.mean - num_std_dev * std_dev
+
+
+class volBuffer(RingBuffer):
+    """The previous list-based buffer's interface on top of RingBuffer."""
+
+    @property
+    def count(self):
+        return len(self)
 
     def add(self, value):
-        self.buffer[self.index] = value  # Add the new value
-        self.index = (self.index + 1) % self.size  # Move to the next index
-        if self.count < self.size:
-            self.count += 1  # Increase count until the buffer is full
+        self.append(value)
 
     def average(self):
-        return sum(self.buffer) / self.count if self.count > 0 else 0.0  # Calculate average
+        return self.get_mean() if self.seq else 0.0
 
     def standard_deviation(self):
-        if self.count < 3:
-            print("not enough data to calculate std")
+        if self.seq < 3:
+            log.debug("not enough data to calculate std")
             return 0.0  # Not enough data to calculate standard deviation
-        return np.std(self.buffer[:self.count])  # Calculate std deviation for filled part of the buffer
-
-    def bollinger_bands(self, period=20, num_std_dev=3):
-        if self.count < period:
-            return None, None, None  # Not enough data to calculate Bollinger Bands
-        mean = self.average()
-        std_dev = self.standard_deviation()
-        upper_band = mean + (num_std_dev * std_dev)
-        lower_band = mean - (num_std_dev * std_dev)
-        return mean, upper_band, lower_band
\ No newline at end of file
+        return self.get_std()
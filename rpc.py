@@ -0,0 +1,48 @@
+import asyncio
+
+
+class RpcCorrelator:
+    """
+    Matches JSON-RPC responses to the requests that produced them.
+
+    Every request gets a unique id and an asyncio.Future; the receive loop
+    hands each frame with an "id" to `resolve`, which completes the matching
+    future. Frames that are not responses to a pending request (subscription
+    notifications, late responses) are left for the caller to route.
+    """
+
+    def __init__(self, start_id=1):
+        self.next_id = start_id
+        self.pending = {}  # Request id -> Future
+
+    def __len__(self):
+        return len(self.pending)
+
+    def register(self):
+        """Allocate a request id and the future its response will resolve."""
+        request_id = self.next_id
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        return request_id, future
+
+    def resolve(self, message):
+        """Complete the future for a response; returns False if nothing was waiting on it."""
+        future = self.pending.pop(message.get('id'), None)
+        if future is None:
+            return False
+        if not future.done():
+            future.set_result(message)
+        return True
+
+    def discard(self, request_id):
+        """Forget a request, e.g. after it timed out."""
+        self.pending.pop(request_id, None)
+
+    def fail_all(self, exc):
+        """Fail every in-flight request, e.g. when the connection drops."""
+        pending = self.pending
+        self.pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
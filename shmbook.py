@@ -0,0 +1,135 @@
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# Header layout (int64 slots)
+SEQ = 0  # Seqlock counter: odd while a write is in progress
+CHANGE_ID = 1
+EXCHANGE_TS = 2  # Exchange timestamp in ms, 0 if unknown
+PUBLISH_NS = 3  # time.time_ns() at publish
+N_BIDS = 4
+N_ASKS = 5
+LEVELS = 6
+HEADER_SLOTS = 8
+HEADER_BYTES = HEADER_SLOTS * 8
+
+
+def block_name(prefix, instrument_name):
+    """Shared memory block name for an instrument ('/' is not allowed in names)."""
+    return f"{prefix}_{instrument_name}".replace('/', '_')
+
+
+def _attach(name):
+    """Attach to an existing block without letting this process's resource tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedBookWriter:
+    """
+    Publishes the top `levels` levels of one book into a shared memory block.
+
+    The block is an int64 header followed by a (4, levels) float64 array of
+    bid prices, bid amounts, ask prices and ask amounts, best level first.
+    Writes are guarded by a seqlock so readers in other processes never need
+    a lock: the sequence number is odd while a write is in progress.
+    """
+
+    def __init__(self, name, levels=20):
+        self.name = name
+        self.levels = levels
+        size = HEADER_BYTES + 4 * levels * 8
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a previous run; reuse it if the layout matches
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm.size < size:
+                self.shm.close()
+                raise ValueError(f"Shared memory block {name} is too small for {levels} levels")
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((4, levels), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.header[:] = 0
+        self.header[LEVELS] = levels
+
+    def publish(self, bids, asks, change_id=0, timestamp=None):
+        """Copy the top of two BookSides into the block."""
+        header = self.header
+        data = self.data
+        seq = int(header[SEQ])
+        header[SEQ] = seq + 1  # Odd: readers must retry
+
+        bid_prices, bid_amounts = bids.depth(self.levels)
+        ask_prices, ask_amounts = asks.depth(self.levels)
+        n_bids = bid_prices.shape[0]
+        n_asks = ask_prices.shape[0]
+        data[0, :n_bids] = bid_prices
+        data[1, :n_bids] = bid_amounts
+        data[2, :n_asks] = ask_prices
+        data[3, :n_asks] = ask_amounts
+        header[CHANGE_ID] = change_id or 0
+        header[EXCHANGE_TS] = timestamp or 0
+        header[PUBLISH_NS] = time.time_ns()
+        header[N_BIDS] = n_bids
+        header[N_ASKS] = n_asks
+
+        header[SEQ] = seq + 2  # Even: consistent again
+
+    def close(self, unlink=True):
+        del self.header, self.data
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedBookReader:
+    """
+    Reads a block published by SharedBookWriter from any process.
+
+    `snapshot()` copies the block into a buffer preallocated by the reader and
+    retries if a write raced with the copy, so the result is always one
+    consistent book state. `view()` gives the live arrays without copying for
+    callers that check `version` themselves.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.shm = _attach(name)
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        self.levels = int(self.header[LEVELS])
+        self.data = np.ndarray((4, self.levels), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.out = np.empty((4, self.levels), dtype=np.float64)
+        self.out_header = np.empty((HEADER_SLOTS,), dtype=np.int64)
+
+    @property
+    def version(self):
+        return int(self.header[SEQ])
+
+    def view(self):
+        """Live (header, data) arrays; only consistent while `version` is unchanged and even."""
+        return self.header, self.data
+
+    def snapshot(self, max_retries=1000):
+        """
+        Return (header, data) copied into this reader's buffers, or None if the
+        writer kept the block busy for `max_retries` attempts.
+        """
+        header = self.header
+        for _ in range(max_retries):
+            seq = header[SEQ]
+            if seq & 1:
+                continue
+            self.out_header[:] = header
+            self.out[:] = self.data
+            if header[SEQ] == seq:
+                return self.out_header, self.out
+        return None
+
+    def close(self):
+        del self.header, self.data
+        self.shm.close()
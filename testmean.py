@@ -1,7 +1,10 @@
+import math
+
 import numpy as np
-import statsmodels.api as sm
 
 def estimate_mean_reversion_rate(spread_data):
+    import statsmodels.api as sm  # Only needed for this batch fit
+
     # Calculate the changes in spread (Delta S)
     delta_S = np.diff(spread_data)
     
@@ -22,9 +25,109 @@ def estimate_mean_reversion_rate(spread_data):
 
     return alpha, S_eq, model
 
-# Example Usage
-spread_data = np.array([6.0, 5.9, 5.7, 5.5, 5.3, 5.2, 5.0, 4.9, 5.1, 5.0, 4.8, 4.9, 5.0])
 
-alpha, S_eq, model = estimate_mean_reversion_rate(spread_data)
-print(f"Estimated mean-reversion rate (alpha): {alpha:.4f}")
-print(f"Estimated equilibrium spread (S_eq): {S_eq:.4f}")
+class OnlineMeanReversion:
+    """
+    Recursive least squares fit of Delta S = c - alpha * S(t), one spread
+    observation at a time.
+
+    Same regression as `estimate_mean_reversion_rate`, but each observation
+    updates the two coefficients and their 2x2 covariance in O(1), and
+    older observations are down-weighted by `forgetting` per step (0.99
+    remembers roughly the last 100), so the fit follows a changing market.
+    The residual variance is tracked the same way and gives sigma.
+
+    With `interval_ms` set, `observe_book` samples the spread once per
+    interval of book time, which fixes delta_t for the spread model.
+    """
+
+    def __init__(self, forgetting=0.99, delta=1000.0, interval_ms=None, min_observations=10):
+        self.forgetting = forgetting
+        self.interval_ms = interval_ms
+        self.min_observations = min_observations
+        # Coefficients of [1, S(t)] and their (scaled) covariance, large = uninformed
+        self.c = 0.0
+        self.b = 0.0
+        self.p00 = delta
+        self.p01 = 0.0
+        self.p11 = delta
+        self.residual_var = 0.0
+        self.weight = 0.0  # Sum of lam^k over past observations: the effective sample count
+        self.observations = 0
+        self.last_spread = None
+        self.next_sample_ms = None
+
+    @property
+    def ready(self):
+        return self.observations >= self.min_observations
+
+    @property
+    def alpha(self):
+        return -self.b
+
+    @property
+    def S_eq(self):
+        """Equilibrium spread, or None while the fit is not mean reverting (alpha <= 0)."""
+        return self.c / -self.b if self.b < 0 else None
+
+    @property
+    def sigma(self):
+        return math.sqrt(self.residual_var)
+
+    def update(self, spread):
+        """Add one spread observation; returns (alpha, S_eq)."""
+        previous = self.last_spread
+        self.last_spread = spread
+        if previous is None:
+            return self.alpha, self.S_eq
+
+        x = previous
+        y = spread - previous
+        lam = self.forgetting
+        p00, p01, p11 = self.p00, self.p01, self.p11
+
+        px0 = p00 + p01 * x
+        px1 = p01 + p11 * x
+        denom = lam + px0 + x * px1
+        k0 = px0 / denom
+        k1 = px1 / denom
+        error = y - (self.c + self.b * x)
+        self.c += k0 * error
+        self.b += k1 * error
+
+        self.p00 = (p00 - k0 * px0) / lam
+        self.p01 = (p01 - k0 * px1) / lam
+        self.p11 = (p11 - k1 * px1) / lam
+        # Weighted mean of squared errors; with lam == 1 a plain running mean
+        self.weight = lam * self.weight + 1.0
+        self.residual_var += (error * error - self.residual_var) / self.weight
+        self.observations += 1
+        return self.alpha, self.S_eq
+
+    def observe_book(self, book):
+        """BookManager listener: feed the book's spread (sampled every `interval_ms` of book time if set)."""
+        best_bid, _ = book.best_bid()
+        best_ask, _ = book.best_ask()
+        if best_bid is None or best_ask is None:
+            return False
+        if self.interval_ms is not None:
+            timestamp = book.timestamp or 0
+            if self.next_sample_ms is not None and timestamp < self.next_sample_ms:
+                return False
+            self.next_sample_ms = (timestamp // self.interval_ms + 1) * self.interval_ms
+        self.update(best_ask - best_bid)
+        return True
+
+
+if __name__ == "__main__":
+    # Example Usage
+    spread_data = np.array([6.0, 5.9, 5.7, 5.5, 5.3, 5.2, 5.0, 4.9, 5.1, 5.0, 4.8, 4.9, 5.0])
+
+    alpha, S_eq, model = estimate_mean_reversion_rate(spread_data)
+    print(f"Estimated mean-reversion rate (alpha): {alpha:.4f}")
+    print(f"Estimated equilibrium spread (S_eq): {S_eq:.4f}")
+
+    online = OnlineMeanReversion(forgetting=1.0, delta=1e6)
+    for spread in spread_data:
+        online.update(spread)
+    print(f"Online estimate: alpha {online.alpha:.4f}, S_eq {online.S_eq:.4f}, sigma {online.sigma:.4f}")
@@ -1,11 +1,41 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+from testmean import OnlineMeanReversion
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
 class MarketMaker:
     def __init__(self, alpha, sigma, S_eq, S_initial):
         self.alpha = alpha
         self.sigma = sigma
         self.S_eq = S_eq
         self.S = S_initial
+        self.estimator = None
+
+    def track(self, books, instrument_name, estimator=None):
+        """
+        Follow the live spread of an instrument: every book update feeds an
+        OnlineMeanReversion fit, and alpha, S_eq, sigma and S are taken from
+        it once it is warm and mean reverting.
+        """
+        self.estimator = estimator or OnlineMeanReversion()
+        books.add_listener(self.on_book, instrument_name)
+        return self.estimator
+
+    def on_book(self, book):
+        estimator = self.estimator
+        if not estimator.observe_book(book):
+            return
+        self.S = estimator.last_spread
+        S_eq = estimator.S_eq
+        if estimator.ready and S_eq is not None:
+            self.alpha = estimator.alpha
+            self.S_eq = S_eq
+            self.sigma = estimator.sigma
 
     def calculate_spread_next(self, delta_t=1):
         # Calculate the next spread using the discrete time model
@@ -33,11 +63,139 @@ class MarketMaker:
                 break
         return rates_of_change
 
-# Example Usage
-alpha = 0.1  # Mean reversion rate
-sigma = 43  # Volatility
-S_eq = 5.0   # Equilibrium spread
-S_initial = 6.0  # Initial spread
+    def monte_carlo(self, paths=10000, steps=60, minimum_ticksize=2.5, delta_t=1, seed=None, workers=None):
+        """Vectorized version of simulate_to_minimum_ticksize over many paths, from the current spread."""
+        return monte_carlo(self.alpha, self.sigma, self.S_eq, self.S, paths, steps, minimum_ticksize, delta_t, seed, workers)
+
+
+def simulate_paths(alpha, sigma, S_eq, S_initial, paths, steps, delta_t=1, rng=None):
+    """
+    Spread paths of the discrete OU model, shape (paths, steps + 1), column 0 = S_initial.
+
+    All shocks are drawn as one (paths, steps) matrix; the recursion then
+    runs over time with whole-column operations, so the Python loop is
+    `steps` long whatever the number of paths.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    spreads = np.empty((paths, steps + 1))
+    spreads[:, 0] = S_initial
+    # S' = S + dt * -alpha * (S - S_eq) + sigma * sqrt(dt) * Z  ==  decay * S + drift + shock
+    shocks = rng.standard_normal((paths, steps))
+    shocks *= sigma * np.sqrt(delta_t)
+    decay = 1 - alpha * delta_t
+    drift = alpha * delta_t * S_eq
+    for step in range(steps):
+        column = spreads[:, step + 1]
+        np.multiply(spreads[:, step], decay, out=column)
+        column += drift
+        column += shocks[:, step]
+    return spreads
+
+
+def first_passage(spreads, minimum_ticksize, delta_t=1):
+    """Time at which each path first reaches the floor (NaN if it never does), and the step index (steps + 1 if never)."""
+    hit = spreads[:, 1:] <= minimum_ticksize
+    reached = hit.any(axis=1)
+    steps = np.where(reached, hit.argmax(axis=1) + 1, spreads.shape[1])
+    times = np.where(reached, steps * delta_t, np.nan)
+    return times, steps
+
+
+def _simulate_chunk(alpha, sigma, S_eq, S_initial, paths, steps, minimum_ticksize, delta_t, seed):
+    """One chunk of paths: first-passage times and the rates of change up to and including the passage."""
+    spreads = simulate_paths(alpha, sigma, S_eq, S_initial, paths, steps, delta_t, np.random.default_rng(seed))
+    times, passage_steps = first_passage(spreads, minimum_ticksize, delta_t)
+    rates = np.diff(spreads, axis=1) / delta_t
+    # Like the single-path simulation, a path stops at the step it reaches the floor
+    live = np.arange(1, steps + 1) <= passage_steps[:, None]
+    return times, rates[live]
+
+
+def _summarize(times, rates):
+    reached = ~np.isnan(times)
+    return {
+        "paths": len(times),
+        "hit_probability": float(reached.mean()),
+        "first_passage_mean": float(times[reached].mean()) if reached.any() else None,
+        "first_passage_percentiles": dict(zip(PERCENTILES, np.percentile(times[reached], PERCENTILES).tolist())) if reached.any() else None,
+        "rate_mean": float(rates.mean()),
+        "rate_std": float(rates.std()),
+        "rate_percentiles": dict(zip(PERCENTILES, np.percentile(rates, PERCENTILES).tolist())),
+    }
+
+
+def _chunks(paths, chunk_size, seed):
+    """Path counts per chunk with independent child seeds, so results do not depend on the worker count."""
+    counts = [chunk_size] * (paths // chunk_size)
+    if paths % chunk_size:
+        counts.append(paths % chunk_size)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return zip(counts, seed.spawn(len(counts)))
+
+
+def monte_carlo(alpha, sigma, S_eq, S_initial, paths=10000, steps=60, minimum_ticksize=2.5, delta_t=1,
+                seed=None, workers=None, chunk_size=10000):
+    """
+    First-passage time to `minimum_ticksize` and rate-of-change distribution
+    over `paths` simulated paths of `steps` steps. Paths are simulated in
+    chunks of `chunk_size`; `workers` > 1 spreads the chunks over a process
+    pool. Returns a summary dict (see _summarize).
+    """
+    jobs = [(alpha, sigma, S_eq, S_initial, count, steps, minimum_ticksize, delta_t, child)
+            for count, child in _chunks(paths, chunk_size, seed)]
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_chunk, *zip(*jobs)))
+    else:
+        results = [_simulate_chunk(*job) for job in jobs]
+    return _summarize(np.concatenate([times for times, _ in results]), np.concatenate([rates for _, rates in results]))
+
+
+def sweep(alphas, sigmas, S_eqs, S_initial, paths=10000, steps=60, minimum_ticksize=2.5, delta_t=1,
+          seed=None, workers=None, chunk_size=10000):
+    """
+    monte_carlo over every (alpha, sigma, S_eq) combination of the grids.
+    All chunks of all grid points share one process pool when `workers` > 1.
+    Returns a list of summaries with the parameters added.
+    """
+    grid = list(itertools.product(alphas, sigmas, S_eqs))
+    seeds = np.random.SeedSequence(seed).spawn(len(grid))
+    jobs = []
+    owners = []
+    for index, ((alpha, sigma, S_eq), grid_seed) in enumerate(zip(grid, seeds)):
+        for count, child in _chunks(paths, chunk_size, grid_seed):
+            jobs.append((alpha, sigma, S_eq, S_initial, count, steps, minimum_ticksize, delta_t, child))
+            owners.append(index)
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_chunk, *zip(*jobs), chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        results = [_simulate_chunk(*job) for job in jobs]
+
+    by_point = [[] for _ in grid]
+    for owner, result in zip(owners, results):
+        by_point[owner].append(result)
+    summaries = []
+    for (alpha, sigma, S_eq), chunk_results in zip(grid, by_point):
+        summary = _summarize(np.concatenate([times for times, _ in chunk_results]),
+                             np.concatenate([rates for _, rates in chunk_results]))
+        summary.update(alpha=alpha, sigma=sigma, S_eq=S_eq)
+        summaries.append(summary)
+    return summaries
+
+
+if __name__ == "__main__":
+    # Example Usage
+    alpha = 0.1  # Mean reversion rate
+    sigma = 43  # Volatility
+    S_eq = 5.0   # Equilibrium spread
+    S_initial = 6.0  # Initial spread
+
+    market_maker = MarketMaker(alpha, sigma, S_eq, S_initial)
+    rates_of_change = market_maker.simulate_to_minimum_ticksize()
 
-market_maker = MarketMaker(alpha, sigma, S_eq, S_initial)
-rates_of_change = market_maker.simulate_to_minimum_ticksize()
+    summary = monte_carlo(alpha, sigma, S_eq, S_initial, paths=100000, seed=1, workers=os.cpu_count())
+    print(f"Monte Carlo: floor reached on {summary['hit_probability']:.1%} of paths, "
+          f"mean first passage {summary['first_passage_mean']} minutes")
@@ -0,0 +1,154 @@
+import math
+
+from ringbuffer import RingBuffer
+
+ESTIMATORS = ("close_to_close", "parkinson", "garman_klass", "realized")
+PARKINSON_SCALE = 1 / (4 * math.log(2))
+GARMAN_KLASS_SCALE = 2 * math.log(2) - 1
+RESOLUTION_SECONDS = {"1D": 86400}  # chart.trades resolutions that are not a number of minutes
+
+
+def resolution_seconds(resolution):
+    """Bar length in seconds of a chart.trades resolution ("1", "60", "1D", ...)."""
+    return RESOLUTION_SECONDS.get(resolution) or int(resolution) * 60
+
+
+class BarVolatility:
+    """
+    Streaming realized-volatility estimators for one instrument.
+
+    Each completed bar adds one per-bar variance term per estimator:
+
+        close_to_close  ln(C_t / C_t-1)^2
+        parkinson       ln(H/L)^2 / (4 ln 2)
+        garman_klass    0.5 ln(H/L)^2 - (2 ln 2 - 1) ln(C/O)^2
+        realized        sum of squared log returns between trades in the bar
+
+    The terms go into one RingBuffer per estimator with a window per
+    horizon, so a bar is an O(1) update and the variance over any horizon is
+    the window mean. chart.trades repeats the current candle until it
+    closes, so a bar is only committed when a newer tick arrives.
+    """
+
+    def __init__(self, instrument_name, bar_seconds=60, horizons=(5, 15, 60)):
+        self.instrument_name = instrument_name
+        self.bar_seconds = bar_seconds
+        self.bar_ms = bar_seconds * 1000
+        self.horizons = tuple(sorted(horizons))
+        size = self.horizons[-1]
+        self.buffers = {name: RingBuffer(size, windows=self.horizons[:-1]) for name in ESTIMATORS}
+        self.bars = 0
+
+        self.candle = None  # (tick, open, high, low, close) of the bar still being built
+        self.last_close = None
+        # Realized variance from raw trades, bucketed by bar start time
+        self.trade_bar = None
+        self.trade_rv = 0.0
+        self.last_trade_price = None
+
+    def on_candle(self, tick, open_price, high_price, low_price, close_price):
+        """Feed a chart.trades update; returns True when it closed the previous bar."""
+        candle = self.candle
+        self.candle = (tick, open_price, high_price, low_price, close_price)
+        if candle is None or tick <= candle[0]:
+            return False  # Same bar, updated (or a late repeat)
+        self.commit(*candle[1:])
+        return True
+
+    def commit(self, open_price, high_price, low_price, close_price):
+        """Add one completed OHLC bar."""
+        if not (open_price > 0 and high_price > 0 and low_price > 0 and close_price > 0):
+            return
+        high_low = math.log(high_price / low_price) ** 2
+        close_open = math.log(close_price / open_price) ** 2
+        self.buffers["parkinson"].append(high_low * PARKINSON_SCALE)
+        self.buffers["garman_klass"].append(max(0.5 * high_low - GARMAN_KLASS_SCALE * close_open, 0.0))
+        if self.last_close is not None:
+            self.buffers["close_to_close"].append(math.log(close_price / self.last_close) ** 2)
+        self.last_close = close_price
+        self.bars += 1
+
+    def on_trades(self, trades):
+        """Feed raw trades (dicts with price and timestamp in ms), oldest first."""
+        for trade in trades:
+            price = trade.get('price')
+            if not price or price <= 0:
+                continue
+            bar = trade['timestamp'] // self.bar_ms
+            if self.trade_bar is None:
+                self.trade_bar = bar
+            elif bar > self.trade_bar:
+                # Bars without trades contribute nothing to realized variance and are not recorded
+                self.buffers["realized"].append(self.trade_rv)
+                self.trade_bar = bar
+                self.trade_rv = 0.0
+            if self.last_trade_price is not None:
+                self.trade_rv += math.log(price / self.last_trade_price) ** 2
+            self.last_trade_price = price
+
+    def variance(self, estimator="garman_klass", horizon=None):
+        """Per-bar variance of log returns over the last `horizon` bars, or None before any bar."""
+        buffer = self.buffers[estimator]
+        if not len(buffer):
+            return None
+        return buffer.get_mean(horizon)
+
+    def sigma(self, estimator="garman_klass", horizon=None, seconds=None):
+        """Log-return volatility over `seconds` (default: one bar), from the last `horizon` bars."""
+        variance = self.variance(estimator, horizon)
+        if variance is None:
+            return None
+        if seconds is not None:
+            variance *= seconds / self.bar_seconds
+        return math.sqrt(variance)
+
+    def price_sigma(self, estimator="garman_klass", horizon=None, seconds=None):
+        """sigma in price units, at the last bar close (or trade price)."""
+        sigma = self.sigma(estimator, horizon, seconds)
+        price = self.last_close or self.last_trade_price
+        if sigma is None or price is None:
+            return None
+        return sigma * price
+
+    def report(self, seconds=None):
+        """sigma per estimator per horizon."""
+        return {
+            name: {horizon: self.sigma(name, horizon, seconds) for horizon in self.horizons}
+            for name in ESTIMATORS
+        }
+
+
+class VolatilityEngine:
+    """BarVolatility per instrument, created on the first candle or trade for it."""
+
+    def __init__(self, horizons=(5, 15, 60), bar_seconds=60):
+        self.horizons = horizons
+        self.bar_seconds = bar_seconds  # For instruments only fed by raw trades
+        self.instruments = {}  # instrument name -> BarVolatility
+
+    def get(self, instrument_name, bar_seconds=None):
+        estimator = self.instruments.get(instrument_name)
+        if estimator is None:
+            estimator = BarVolatility(instrument_name, bar_seconds or self.bar_seconds, self.horizons)
+            self.instruments[instrument_name] = estimator
+        return estimator
+
+    def on_chart_trades(self, channel, data):
+        """Feed a chart.trades.{instrument}.{resolution} notification."""
+        _, _, instrument_name, resolution = channel.split('.', 3)
+        bar_seconds = resolution_seconds(resolution)
+        estimator = self.get(instrument_name, bar_seconds)
+        if estimator.bar_seconds != bar_seconds:
+            return False  # One resolution per instrument: the first one subscribed
+        return estimator.on_candle(data['tick'], data['open'], data['high'], data['low'], data['close'])
+
+    def on_trades(self, instrument_name, trades):
+        self.get(instrument_name).on_trades(trades)
+
+    def sigma(self, instrument_name, estimator="garman_klass", horizon=None, seconds=None):
+        volatility = self.instruments.get(instrument_name)
+        return volatility.sigma(estimator, horizon, seconds) if volatility is not None else None
+
+    def price_sigma(self, instrument_name, estimator="garman_klass", horizon=None, seconds=None):
+        volatility = self.instruments.get(instrument_name)
+        return volatility.price_sigma(estimator, horizon, seconds) if volatility is not None else None